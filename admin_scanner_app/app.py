@@ -1,31 +1,184 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, render_template, request, jsonify, send_file, stream_with_context, url_for
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import false, func, select, union_all, update
+import click
+import json
 import os
 import sys
+import tempfile
+import time
 
 # Add parent directory to path for shared models
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from models import db, Student, LunchPass
-from datetime import datetime
+from models import db, Student, LunchPass, LunchPassArchive, ImportJob, reconcile_counters
+import db_engine
+import migrations
+import repository
+from metrics import Metrics
+import profiling
+from roster_import import EXTENSIONS as ROSTER_EXTENSIONS, RosterError, import_roster
+from stats_stream import StatsBroadcaster
+from token_index import TokenIndex
+from write_behind import RedemptionQueue, configured_workers
+from import_jobs import ImportWorker
+from preissue import preissue_passes, prerender_passes
+from rollover import meal_day_start, rollover_passes
+from qr_sheets import write_sheets
+from datetime import datetime, timezone
+import qr_render
+import signed_pass
 
 app = Flask(__name__)
 
 # Database Configuration
-# Point to root directory for shared database between apps
-ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-DB_PATH = os.path.join(ROOT_DIR, 'canteen_data.db')
-DATABASE_URL = os.getenv('DATABASE_URL', f'sqlite:///{DB_PATH}')
-if DATABASE_URL.startswith('postgres://'):
-    DATABASE_URL = DATABASE_URL.replace('postgres://', 'postgresql://', 1)
+# Shared canteen_data.db at the repository root unless DATABASE_URL is set
+DATABASE_URL = db_engine.database_url()
 
 app.config['SQLALCHEMY_DATABASE_URI'] = DATABASE_URL
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = db_engine.engine_options(DATABASE_URL)
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'admin-secret-key-change-this')
+app.config['MAX_CONTENT_LENGTH'] = 32 * 1024 * 1024  # roster uploads
 
 db.init_app(app)
 
-def create_tables():
-    db.create_all()
+PASS_SIGNING_KEY = signed_pass.signing_key(app.config['SECRET_KEY'])
+
+request_metrics = Metrics('admin_scanner')
+profiler = profiling.Profiler('admin_scanner')
+
+with app.app_context():
+    db_engine.configure(db.engine)
+    migrations.upgrade(db.engine, db.metadata)
+    request_metrics.init_app(app, db.engine)
+    profiler.init_app(app, db.engine)
+
+MAX_BATCH_SCANS = 500
+
+TOKEN_LOAD_BATCH = 10000
+
+def count_issued_tokens():
+    """Passes ever issued, live and archived, from the trigger-maintained counter"""
+    return repository.stats(db.session)['total_passes_generated']
+
+def load_issued_tokens():
+    """(id, token) of every pass ever issued, live and archived, streamed in batches"""
+    return db.session.execute(
+        union_all(select(LunchPass.id, LunchPass.token), select(LunchPassArchive.id, LunchPassArchive.token))
+        .execution_options(yield_per=TOKEN_LOAD_BATCH)
+    )
+
+def load_newer_tokens(after_id):
+    """Passes with an id above `after_id`, including any already rolled over into the archive"""
+    return db.session.execute(union_all(
+        select(LunchPass.id, LunchPass.token).where(LunchPass.id > after_id),
+        select(LunchPassArchive.id, LunchPassArchive.token).where(LunchPassArchive.id > after_id),
+    )).all()
+
+def lookup_issued_token(token):
+    return repository.issued_pass_id(db.session, token)
+
+token_index = (
+    TokenIndex(count_issued_tokens, load_issued_tokens, load_newer_tokens, lookup_issued_token)
+    if os.getenv('TOKEN_INDEX', '1').lower() in ('1', 'true', 'yes') else None
+)
+
+if token_index:
+    # Built once per worker at startup rather than on its first scan
+    with app.app_context():
+        token_index.rebuild()
+        db.session.remove()
+
+def flush_deferred_redemptions(items):
+    """Persist queued (token, used_at) redemptions, returning tokens that were already used"""
+    with app.app_context():
+        conflicts = [
+            token for token, used_at in items
+            if not repository.redeem_token(db.session, token, used_at)
+        ]
+        db.session.commit()
+    for token in conflicts:
+        app.logger.warning('Deferred redemption found pass already used: %s', token)
+    return conflicts
+
+deferred_redemptions = (
+    RedemptionQueue(flush_deferred_redemptions)
+    if os.getenv('DEFER_REDEMPTION', '').lower() in ('1', 'true', 'yes') else None
+)
+
+if deferred_redemptions and configured_workers() > 1:
+    raise RuntimeError(
+        'DEFER_REDEMPTION=1 only tracks redemptions within one process; '
+        'run the scanner with a single worker (gunicorn --workers 1) or turn it off'
+    )
+
+def redeem_token(token, used_at=None):
+    """Redeem a token in the current transaction, returning (response body, status code)
+
+    The caller commits, so a batch of scans can share one transaction.
+    Signed passes are checked in-process first, so forgeries and expired
+    passes never reach the database.
+    """
+    if signed_pass.is_signed(token):
+        try:
+            claims = signed_pass.verify(token, PASS_SIGNING_KEY)
+        except signed_pass.ExpiredPass as e:
+            request_metrics.count_scan('expired')
+            return {'error': str(e), 'valid': False}, 400
+        except signed_pass.InvalidPass as e:
+            request_metrics.count_scan('invalid')
+            return {'error': str(e), 'valid': False}, 404
+
+        if deferred_redemptions:
+            # One indexed read: catches passes redeemed before a restart, and
+            # names the holder so staff can check them at the counter
+            holder = repository.rejected_pass(db.session, token)
+            used_in_database = holder is not None and holder.used_at is not None
+            known = {'student_name': holder.name, 'roll_number': holder.roll_number} if holder else {}
+            if not deferred_redemptions.submit(token, claims, used_at or datetime.utcnow(), used_in_database):
+                request_metrics.count_scan('already_used')
+                return {'error': 'Token already used', 'valid': False, 'student_id': claims.student_id,
+                        **known}, 400
+            request_metrics.count_scan('valid')
+            return {
+                'success': True,
+                'valid': True,
+                'student_id': claims.student_id,
+                **known,
+                'message': 'Lunch pass valid! Entry granted.'
+            }, 200
+
+    elif token_index and not token_index.might_contain(token):
+        request_metrics.count_scan('invalid')
+        return {'error': 'Invalid token', 'valid': False}, 404
+
+    redeemed = repository.redeem_token(db.session, token, used_at)
+
+    if redeemed:
+        roll_number, name = redeemed
+        request_metrics.count_scan('valid')
+        return {
+            'success': True,
+            'valid': True,
+            'student_name': name,
+            'roll_number': roll_number,
+            'message': 'Lunch pass valid! Entry granted.'
+        }, 200
+
+    rejected = repository.rejected_pass(db.session, token)
+    if not rejected:
+        if token_index and not signed_pass.is_signed(token):
+            token_index.record_false_positive()
+        request_metrics.count_scan('invalid')
+        return {'error': 'Invalid token', 'valid': False}, 404
+
+    request_metrics.count_scan('already_used')
+    return {
+        'error': 'Token already used',
+        'valid': False,
+        'student_name': rejected.name,
+        'used_at': rejected.used_at
+    }, 400
 
 # ==================== ADMIN PORTAL ====================
 @app.route('/')
@@ -48,18 +201,61 @@ def admin_manage():
     """Manage students"""
     return render_template('admin_manage.html')
 
+STUDENT_PAGE_SIZE = 200
+MAX_STUDENT_PAGE_SIZE = 1000
+
+def list_students(after, prefix, limit):
+    """Stream one keyset page of students, ordered by roll number, with pass counts
+
+    The page of students is picked first and only those rows have their
+    passes, live and archived, counted through the student_id indexes, so
+    cost depends on the page size rather than the roster or pass history.
+    Fetches one extra row to know whether there is a next page.
+    """
+    page = select(Student.id, Student.roll_number, Student.name)
+    if after:
+        page = page.where(Student.roll_number > after)
+    if prefix:
+        page = page.where(repository.roll_prefix_filter(prefix))
+    page = page.order_by(Student.roll_number).limit(limit + 1).subquery()
+
+    def pass_count(model, *conditions):
+        return select(func.count(model.id)).where(model.student_id == page.c.id, *conditions).scalar_subquery()
+
+    rows = db.session.execute(
+        select(
+            page.c.id, page.c.roll_number, page.c.name,
+            (pass_count(LunchPass, LunchPass.used)
+             + pass_count(LunchPassArchive, LunchPassArchive.used)).label('passes_used'),
+            (pass_count(LunchPass) + pass_count(LunchPassArchive)).label('passes_total'),
+        )
+        .order_by(page.c.roll_number)
+        .execution_options(yield_per=STUDENT_PAGE_SIZE)
+    )
+
+    def generate():
+        yield '{"students": ['
+        last_roll, next_after = None, None
+        for count, row in enumerate(rows):
+            if count == limit:
+                next_after = last_roll
+                break
+            yield (',' if count else '') + json.dumps(dict(row._mapping))
+            last_roll = row.roll_number
+        rows.close()
+        yield f'], "next_after": {json.dumps(next_after)}}}'
+
+    return Response(stream_with_context(generate()), mimetype='application/json')
+
 @app.route('/admin/api/students', methods=['GET', 'POST'])
 def admin_students():
     """Get all students or add new"""
     if request.method == 'GET':
-        students = Student.query.all()
-        return jsonify([{
-            'id': s.id,
-            'roll_number': s.roll_number,
-            'name': s.name,
-            'passes_used': len([p for p in s.passes if p.used]),
-            'passes_total': len(s.passes)
-        } for s in students])
+        return list_students(
+            after=request.args.get('after', '').strip().upper(),
+            prefix=request.args.get('q', '').strip().upper(),
+            limit=min(max(request.args.get('limit', STUDENT_PAGE_SIZE, type=int), 1), MAX_STUDENT_PAGE_SIZE)
+        )
     
     # POST - Add new student
     data = request.get_json()
@@ -69,7 +265,7 @@ def admin_students():
     if not roll_number or not name:
         return jsonify({'error': 'Roll number and name required'}), 400
     
-    if Student.query.filter_by(roll_number=roll_number).first():
+    if repository.find_student_by_roll(db.session, roll_number):
         return jsonify({'error': 'Roll number already exists'}), 400
     
     new_student = Student(roll_number=roll_number, name=name)
@@ -89,11 +285,133 @@ def delete_student(student_id):
     db.session.commit()
     return jsonify({'success': True})
 
+UPLOAD_DIR = os.getenv('UPLOAD_DIR', os.path.join(tempfile.gettempdir(), 'canteen-uploads'))
+IMPORT_CHUNK_SIZE = 2000
+
+def upload_path(job_id, filename):
+    return os.path.join(UPLOAD_DIR, f'import-{job_id}{os.path.splitext(filename)[1].lower()}')
+
+def run_import_job(job_id):
+    """Import one uploaded roster, recording progress on its import_job row after every chunk"""
+    with app.app_context():
+        job = db.session.get(ImportJob, job_id)
+        job.status, job.started_at = 'running', datetime.utcnow()
+        db.session.commit()
+        path, update_names = upload_path(job.id, job.filename), job.update_names
+
+        def record(**values):
+            db.session.execute(update(ImportJob).where(ImportJob.id == job_id).values(**values))
+            db.session.commit()
+
+        def progress(counts):
+            record(rows=counts['rows'], added=counts['added'], updated=counts['updated'], skipped=counts['skipped'])
+
+        try:
+            result = import_roster(db.session, path, update_names, IMPORT_CHUNK_SIZE, progress)
+        except Exception as e:
+            db.session.rollback()
+            if not isinstance(e, RosterError):
+                app.logger.exception('Roster import job %s failed', job_id)
+            record(status='failed', error=str(e)[:1000], finished_at=datetime.utcnow())
+        else:
+            record(status='done', rows=result['rows'], added=result['added'], updated=result['updated'],
+                   skipped=result['skipped'], finished_at=datetime.utcnow())
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
+
+import_worker = ImportWorker(run_import_job)
+
+@app.route('/admin/api/students/upload', methods=['POST'])
+def upload_students():
+    """Queue a roster file (.csv or .xlsx) for import in the background"""
+    upload = request.files.get('file')
+    if not upload or not upload.filename:
+        return jsonify({'error': 'Roster file required'}), 400
+    if os.path.splitext(upload.filename)[1].lower() not in ROSTER_EXTENSIONS:
+        return jsonify({'error': 'Upload a .csv or .xlsx file'}), 400
+    
+    job = ImportJob(
+        filename=os.path.basename(upload.filename)[-255:],
+        update_names=request.form.get('update_names', '').lower() in ('1', 'true', 'on')
+    )
+    db.session.add(job)
+    db.session.commit()
+    
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    upload.save(upload_path(job.id, job.filename))
+    import_worker.submit(job.id)
+    return jsonify({
+        'success': True,
+        'job_id': job.id,
+        'status_url': url_for('import_job_status', job_id=job.id)
+    }), 202
+
+@app.route('/admin/api/import-jobs/<int:job_id>')
+def import_job_status(job_id):
+    """Progress of a background roster import"""
+    job = db.session.get(ImportJob, job_id)
+    if not job:
+        return jsonify({'error': 'Import job not found'}), 404
+    
+    queued_ahead = None
+    if job.status == 'queued':
+        # Uploads still waiting that came in before this one, whichever worker holds them
+        queued_ahead = db.session.execute(
+            select(func.count(ImportJob.id)).where(ImportJob.status == 'queued', ImportJob.id < job.id)
+        ).scalar()
+    
+    elapsed = None
+    if job.started_at:
+        elapsed = ((job.finished_at or datetime.utcnow()) - job.started_at).total_seconds()
+    return jsonify({
+        'job_id': job.id,
+        'filename': job.filename,
+        'status': job.status,
+        'rows': job.rows,
+        'added': job.added,
+        'updated': job.updated,
+        'skipped': job.skipped,
+        'error': job.error,
+        'created_at': job.created_at.isoformat(),
+        'elapsed_seconds': round(elapsed, 2) if elapsed is not None else None,
+        'rows_per_second': round(job.rows / elapsed) if elapsed else None,
+        'queued_ahead': queued_ahead
+    })
+
+@app.route('/admin/api/passes/preissue', methods=['POST'])
+def admin_preissue_passes():
+    """Issue passes to every student without one, optionally pre-rendering their QR codes"""
+    data = request.get_json(silent=True) or {}
+    issued, report = preissue_passes(db.session, PASS_SIGNING_KEY)
+    if token_index:
+        token_index.refresh()
+    if data.get('render', True) and qr_render.QR_CACHE_DIR:
+        report.update(prerender_passes([token for _, token in issued], qr_render.QR_CACHE_DIR))
+    return jsonify({'success': True, **report})
+
+@app.route('/admin/profiles')
+def admin_profiles():
+    """Request profiles and slow-query reports from every app on this host"""
+    return render_template('admin_profiles.html', reports=profiling.list_reports(profiler.directory),
+                           slow_query_ms=profiler.slow_query_ms, sample_rate=profiler.sample_rate,
+                           directory=profiler.directory)
+
+@app.route('/admin/profiles/<name>')
+def admin_profile_report(name):
+    """One report as text, or its raw cProfile data as a download"""
+    path = profiling.report_path(name, profiler.directory)
+    if not path:
+        return jsonify({'error': 'Report not found'}), 404
+    if name.endswith('.prof'):
+        return send_file(path, mimetype='application/octet-stream', as_attachment=True)
+    return send_file(path, mimetype='text/plain')
+
 # ==================== SCANNER ====================
 @app.route('/scan')
 def scanner():
     """Scanner page"""
-    return render_template('scanner.html')
+    return render_template('scanner.html', max_batch_scans=MAX_BATCH_SCANS)
 
 @app.route('/api/validate-token', methods=['POST'])
 def validate_token():
@@ -103,57 +421,187 @@ def validate_token():
     if not token:
         return jsonify({'error': 'Token required'}), 400
     
-    lunch_pass = LunchPass.query.filter_by(token=token).first()
-    
-    if not lunch_pass:
-        return jsonify({'error': 'Invalid token', 'valid': False}), 404
-    
-    if lunch_pass.used:
-        return jsonify({
-            'error': 'Token already used',
-            'valid': False,
-            'student_name': lunch_pass.student.name,
-            'used_at': lunch_pass.used_at
-        }), 400
-    
-    # Mark as used
-    lunch_pass.used = True
-    lunch_pass.used_at = datetime.utcnow()
+    body, status = redeem_token(token)
     db.session.commit()
-    
+    return jsonify(body), status
+
+def parse_scanned_at(value):
+    """Parse a client scan timestamp (ISO 8601 or epoch milliseconds) as naive UTC
+
+    Missing, unparseable or future timestamps fall back to the server clock.
+    """
+    now = datetime.utcnow()
+    try:
+        if isinstance(value, (int, float)):
+            scanned_at = datetime.fromtimestamp(value / 1000, timezone.utc).replace(tzinfo=None)
+        else:
+            scanned_at = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+            if scanned_at.tzinfo:
+                scanned_at = scanned_at.astimezone(timezone.utc).replace(tzinfo=None)
+    except (TypeError, ValueError, OverflowError, OSError):
+        return now
+    return min(scanned_at, now)
+
+@app.route('/api/validate-tokens', methods=['POST'])
+def validate_tokens():
+    """Redeem a batch of buffered scans from one station in a single transaction"""
+    data = request.get_json() or {}
+    station_id = str(data.get('station_id', '')).strip() or None
+    scans = data.get('scans')
+
+    if not isinstance(scans, list) or not scans:
+        return jsonify({'error': 'Scans required'}), 400
+    if len(scans) > MAX_BATCH_SCANS:
+        return jsonify({'error': f'At most {MAX_BATCH_SCANS} scans per batch'}), 413
+
+    # Buffered scans are often of passes issued after the last refresh; one
+    # range query up front saves turning any of them away
+    if token_index:
+        token_index.refresh()
+
+    results = []
+    for scan in scans:
+        if not isinstance(scan, dict):
+            scan = {'token': scan}
+        token = str(scan.get('token') or '').strip()
+        if not token:
+            results.append({'token': token, 'status': 400, 'error': 'Token required', 'valid': False})
+            continue
+        body, status = redeem_token(token, parse_scanned_at(scan.get('scanned_at')))
+        results.append({'token': token, 'status': status, **body})
+    db.session.commit()
+
+    redeemed = sum(1 for r in results if r.get('valid'))
+    app.logger.info('Station %s flushed %d scans (%d redeemed)', station_id, len(results), redeemed)
     return jsonify({
         'success': True,
-        'valid': True,
-        'student_name': lunch_pass.student.name,
-        'roll_number': lunch_pass.student.roll_number,
-        'message': 'Lunch pass valid! Entry granted.'
+        'station_id': station_id,
+        'redeemed': redeemed,
+        'results': results
     })
 
+@app.route('/api/token-index/stats')
+def token_index_stats():
+    """Size, hit and false-positive figures for this worker's token index, and its deferred redemption backlog"""
+    body = {'enabled': True, **token_index.stats()} if token_index else {'enabled': False}
+    if deferred_redemptions:
+        body['deferred_redemptions'] = deferred_redemptions.stats()
+    return jsonify(body)
+
 # ==================== DASHBOARD ====================
 @app.route('/dashboard')
 def dashboard():
     """Dashboard"""
     return render_template('dashboard.html')
 
+def compute_stats():
+    """Dashboard statistics from the trigger-maintained counters"""
+    return repository.stats(db.session)
+
+def read_stats_for_stream():
+    with app.app_context():
+        return compute_stats()
+
+stats_broadcaster = StatsBroadcaster(read_stats_for_stream, max_streams=int(os.getenv('MAX_STATS_STREAMS', '4')))
+
 @app.route('/api/stats')
 def get_stats():
     """Get statistics"""
-    total_students = Student.query.count()
-    total_passes_generated = LunchPass.query.count()
-    total_passes_used = LunchPass.query.filter_by(used=True).count()
-    passes_remaining = total_passes_generated - total_passes_used
-    
-    return jsonify({
-        'total_students': total_students,
-        'total_passes_generated': total_passes_generated,
-        'total_passes_used': total_passes_used,
-        'passes_remaining': passes_remaining,
-        'usage_percentage': round((total_passes_used / total_passes_generated * 100) if total_passes_generated > 0 else 0, 1)
+    return jsonify(compute_stats())
+
+@app.route('/api/stats/stream')
+def stream_stats():
+    """Push stats deltas to the dashboard as Server-Sent Events"""
+    frames = stats_broadcaster.stream()
+    if frames is None:
+        # Every stream holds a worker thread; the page polls /api/stats instead
+        return jsonify({'error': 'Too many open dashboards, polling instead'}), 503
+    return Response(frames, mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
     })
 
+# ==================== MAINTENANCE ====================
+@app.cli.command('reconcile-counters')
+def reconcile_counters_command():
+    """Recompute dashboard counters from scratch and report any drift"""
+    drift = reconcile_counters(db.session)
+    if not drift:
+        print("✅ Counters match the tables")
+    for name, (stored, counted) in drift.items():
+        print(f"⚠️  {name}: stored {stored}, counted {counted} (fixed)")
+
+@app.cli.command('preissue-passes')
+@click.option('--chunk-size', default=1000, show_default=True, help='Rows per INSERT and commit')
+@click.option('--qr-dir', default=qr_render.QR_CACHE_DIR, help='Pre-render QR images here (default: $QR_CACHE_DIR)')
+@click.option('--format', 'fmt', type=click.Choice(sorted(qr_render.FORMATS)), default='png', show_default=True)
+@click.option('--workers', type=int, help='QR render processes (default: one per CPU)')
+def preissue_passes_command(chunk_size, qr_dir, fmt, workers):
+    """Issue a pass to every student without one before the meal window"""
+    started = time.perf_counter()
+    issued, report = preissue_passes(db.session, PASS_SIGNING_KEY, chunk_size)
+    print(f"✅ Issued {report['issued']} of {report['eligible_students']} eligible passes "
+          f"in {report['insert_seconds']:.2f}s ({report['rows_per_second'] or 0:,} rows/s)")
+    if qr_dir and issued:
+        report = prerender_passes([token for _, token in issued], qr_dir, fmt, workers)
+        print(f"🖼️  Rendered {report['rendered']} QR codes into {qr_dir} "
+              f"in {report['render_seconds']:.2f}s ({report['renders_per_second'] or 0:,}/s)")
+    elif not qr_dir:
+        print("ℹ️  No --qr-dir or QR_CACHE_DIR set, QR codes will be rendered on demand")
+    print(f"⏱️  Total {time.perf_counter() - started:.2f}s")
+
+@app.cli.command('rollover-passes')
+@click.option('--before', type=click.DateTime(formats=['%Y-%m-%d']),
+              help='Archive passes generated before this day (default: start of today, UTC)')
+@click.option('--batch-size', default=1000, show_default=True, help='Rows moved per transaction')
+@click.option('--pause', default=0.05, show_default=True, help='Seconds between batches, to let scans in')
+def rollover_passes_command(before, batch_size, pause):
+    """Move redeemed and expired passes of past meal days into lunch_pass_archive"""
+    report = rollover_passes(db.session, before or meal_day_start(), batch_size, pause)
+    print(f"📦 Archived {report['moved']} passes from before {report['before'][:10]} in {report['batches']} "
+          f"batches, {report['seconds']:.2f}s ({report['rows_per_second'] or 0:,} rows/s); "
+          f"{report['live_passes']} passes left live")
+
+@app.cli.command('import-students')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--update-names', is_flag=True, help='Also rename students already on the roster')
+@click.option('--chunk-size', default=5000, show_default=True, help='Rows per INSERT and commit')
+def import_students_command(path, update_names, chunk_size):
+    """Import a roster from PATH (.csv or .xlsx)"""
+    try:
+        result = import_roster(db.session, path, update_names, chunk_size)
+    except RosterError as e:
+        raise click.ClickException(str(e))
+    print(f"✅ Imported {result['rows']} rows in {result['seconds']:.2f}s: "
+          f"{result['added']} added, {result['updated']} updated, {result['skipped']} skipped")
+
+@app.cli.command('print-sheets')
+@click.argument('out')
+@click.option('--prefix', default='', help='Only roll numbers starting with this')
+@click.option('--issue', is_flag=True, help='Pre-issue passes to students without one first')
+@click.option('--workers', type=int, help='Page render processes (default: one per CPU)')
+def print_sheets_command(out, prefix, issue, workers):
+    """Write printable QR pass sheets to OUT (a .pdf file, or a directory of PNG pages)"""
+    started = time.perf_counter()
+    if issue:
+        preissue_passes(db.session, PASS_SIGNING_KEY)
+    query = (
+        select(Student.roll_number, Student.name, LunchPass.token)
+        .join(LunchPass, (LunchPass.student_id == Student.id) & (LunchPass.used == false()))
+        .order_by(Student.roll_number)
+    )
+    prefix = prefix.strip().upper()
+    if prefix:
+        query = query.where(repository.roll_prefix_filter(prefix))
+    passes = [tuple(row) for row in db.session.execute(query)]
+    if not passes:
+        print("ℹ️  No active passes to print (use --issue to issue them first)")
+        return
+    pages = write_sheets(passes, out, workers)
+    print(f"🖨️  {len(passes)} passes on {pages} pages written to {out} in {time.perf_counter() - started:.2f}s")
+
 if __name__ == '__main__':
     with app.app_context():
-        create_tables()
         print("\n👨‍💼 ADMIN & SCANNER PORTAL Running!")
         print("📊 Dashboard at: http://localhost:5001")
         print("🔍 Scanner at: http://localhost:5001/scan")
@@ -0,0 +1,41 @@
+"""
+Background worker for roster uploads
+
+An upload is saved to disk, recorded as an import_job row and handed to
+this worker: one thread per process, started on first use, importing jobs
+one at a time so the request that uploaded the file returns at once.
+Progress is written to the job row after every chunk, so any scanner
+worker process can answer the status endpoint. A job whose process dies
+mid-import is left 'running'; upload the file again (the import skips
+students already added).
+"""
+
+import logging
+import queue
+import threading
+
+log = logging.getLogger(__name__)
+
+
+class ImportWorker:
+    def __init__(self, run):
+        """`run(job_id)` performs one import job, recording its own outcome"""
+        self._run = run
+        self._jobs = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def submit(self, job_id):
+        self._jobs.put(job_id)
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._work, name='roster-import', daemon=True)
+                self._thread.start()
+
+    def _work(self):
+        while True:
+            job_id = self._jobs.get()
+            try:
+                self._run(job_id)
+            except Exception:
+                log.exception('Roster import job %s failed', job_id)
@@ -0,0 +1,63 @@
+"""
+Bulk pre-issuance of lunch passes ahead of a meal window
+
+Every student without an unused pass gets one, written in chunked
+multi-row INSERTs (one commit per chunk, so the write lock is only held
+briefly), and the new passes' QR codes can be pre-rendered across a
+process pool into QR_CACHE_DIR. During the rush the student portal then
+only reads: the pass exists and its image is already on disk.
+
+Signed passes are checked by the scanner with PASS_SIGNING_KEY, so with
+SIGNED_PASSES on that key must be the same for both apps.
+"""
+
+import time
+from datetime import datetime
+
+from sqlalchemy import exists, false, select
+
+import qr_render
+import signed_pass
+from models import LunchPass, Student, insert_or_ignore
+
+
+def students_without_pass(session):
+    holds_pass = exists().where(LunchPass.student_id == Student.id, LunchPass.used == false())
+    return session.execute(select(Student.id).where(~holds_pass).order_by(Student.id)).scalars().all()
+
+
+def preissue_passes(session, signing_key, chunk_size=1000):
+    """Issue a pass to every student lacking one; returns the new (pass id, token) rows and timings"""
+    started = time.perf_counter()
+    student_ids = students_without_pass(session)
+    # Students who picked up a pass meanwhile are skipped by the unique index
+    issue = insert_or_ignore(LunchPass, session.get_bind().dialect.name).returning(LunchPass.id, LunchPass.token)
+    now = datetime.utcnow()
+    issued = []
+    for i in range(0, len(student_ids), chunk_size):
+        rows = [
+            {'student_id': student_id, 'token': signed_pass.new_token(student_id, signing_key),
+             'generated_at': now, 'used': False}
+            for student_id in student_ids[i:i + chunk_size]
+        ]
+        issued.extend(tuple(row) for row in session.execute(issue, rows))
+        session.commit()
+    seconds = time.perf_counter() - started
+    return issued, {
+        'eligible_students': len(student_ids),
+        'issued': len(issued),
+        'insert_seconds': round(seconds, 3),
+        'rows_per_second': round(len(issued) / seconds) if seconds else None,
+    }
+
+
+def prerender_passes(tokens, directory, fmt='png', workers=None):
+    """Pre-render QR images for `tokens` into `directory`; returns timings"""
+    started = time.perf_counter()
+    rendered = qr_render.prerender_all(tokens, directory, fmt, workers=workers)
+    seconds = time.perf_counter() - started
+    return {
+        'rendered': rendered,
+        'render_seconds': round(seconds, 3),
+        'renders_per_second': round(rendered / seconds) if seconds else None,
+    }
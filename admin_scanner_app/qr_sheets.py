@@ -0,0 +1,148 @@
+"""
+Printable sheets of QR passes
+
+Lays passes out twelve to an A4 page (at 150 dpi) with the student's name
+and roll number under each code and cut lines around it. Pages are
+rendered across a process pool and written out one at a time as they
+arrive, either as numbered PNGs or into one PDF, so memory stays flat
+however long the roster is. Pillow's PDF writer needs every page up front
+(or re-reads the file on each append), so PDFs go through PdfPageWriter,
+which streams each page as one compressed 1-bit image.
+"""
+
+import os
+import zlib
+from multiprocessing import get_context
+
+from PIL import Image, ImageDraw, ImageFont
+
+import qr_render
+
+DPI = 150
+PAGE_SIZE = (1240, 1754)  # A4 at 150 dpi
+MARGIN = 60
+COLUMNS, ROWS = 3, 4
+PER_PAGE = COLUMNS * ROWS
+LABEL_HEIGHT = 80
+
+_fonts = None
+
+
+def _load_fonts():
+    global _fonts
+    try:
+        _fonts = (ImageFont.truetype('DejaVuSans-Bold.ttf', 24), ImageFont.truetype('DejaVuSans.ttf', 20))
+    except OSError:
+        default = ImageFont.load_default()
+        _fonts = (default, default)
+    return _fonts
+
+
+def _centered_text(draw, x, y, width, text, font):
+    while len(text) > 1 and draw.textlength(text, font=font) > width - 10:
+        text = text[:-2] + '…'
+    draw.text((x + (width - draw.textlength(text, font=font)) / 2, y), text, font=font, fill=0)
+
+
+def render_page(passes):
+    """1-bit page image for up to PER_PAGE (roll_number, name, token) rows"""
+    name_font, roll_font = _fonts or _load_fonts()
+    page = Image.new('1', PAGE_SIZE, 1)
+    draw = ImageDraw.Draw(page)
+    tile_width = (PAGE_SIZE[0] - 2 * MARGIN) // COLUMNS
+    tile_height = (PAGE_SIZE[1] - 2 * MARGIN) // ROWS
+    for i, (roll_number, name, token) in enumerate(passes):
+        x = MARGIN + (i % COLUMNS) * tile_width
+        y = MARGIN + (i // COLUMNS) * tile_height
+        matrix = qr_render.qr_matrix(token)
+        box_size = (min(tile_width, tile_height - LABEL_HEIGHT) - 20) // len(matrix)
+        code = qr_render.qr_image(matrix, box_size)
+        page.paste(code, (x + (tile_width - code.width) // 2, y + 10))
+        label_y = y + 10 + code.height
+        _centered_text(draw, x, label_y, tile_width, name, name_font)
+        _centered_text(draw, x, label_y + 32, tile_width, roll_number, roll_font)
+        draw.rectangle([x, y, x + tile_width - 1, y + tile_height - 1], outline=0)
+    return page
+
+
+class PdfPageWriter:
+    """Write a PDF of full-page 1-bit images one page at a time"""
+
+    def __init__(self, path, size, dpi):
+        self._file = open(path, 'wb')
+        self._size = size
+        self._media_box = f'[0 0 {size[0] * 72 / dpi:.2f} {size[1] * 72 / dpi:.2f}]'
+        self._offsets = [None, None]  # catalog and page tree are written last
+        self._pages = []
+        self._file.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+
+    def _object(self, body, stream=None, number=None):
+        if number is None:
+            self._offsets.append(None)
+            number = len(self._offsets)
+        self._offsets[number - 1] = self._file.tell()
+        self._file.write(f'{number} 0 obj\n{body}\n'.encode())
+        if stream is not None:
+            self._file.write(b'stream\n' + stream + b'\nendstream\n')
+        self._file.write(b'endobj\n')
+        return number
+
+    def add_page(self, packed_pixels):
+        """Append a page given as zlib-compressed 1-bit rows (Pillow's mode '1' tobytes)"""
+        width, height = self._size
+        image = self._object(
+            f'<< /Type /XObject /Subtype /Image /Width {width} /Height {height} /ColorSpace /DeviceGray '
+            f'/BitsPerComponent 1 /Filter /FlateDecode /Length {len(packed_pixels)} >>',
+            packed_pixels,
+        )
+        _, _, page_width, page_height = self._media_box.strip('[]').split()
+        draw = f'q {page_width} 0 0 {page_height} 0 0 cm /Im0 Do Q'.encode()
+        content = self._object(f'<< /Length {len(draw)} >>', draw)
+        self._pages.append(self._object(
+            f'<< /Type /Page /Parent 2 0 R /MediaBox {self._media_box} '
+            f'/Resources << /XObject << /Im0 {image} 0 R >> >> /Contents {content} 0 R >>'
+        ))
+
+    def close(self):
+        kids = ' '.join(f'{page} 0 R' for page in self._pages)
+        self._object('<< /Type /Catalog /Pages 2 0 R >>', number=1)
+        self._object(f'<< /Type /Pages /Kids [{kids}] /Count {len(self._pages)} >>', number=2)
+        xref = self._file.tell()
+        self._file.write(f'xref\n0 {len(self._offsets) + 1}\n0000000000 65535 f \n'.encode())
+        self._file.write(b''.join(b'%010d 00000 n \n' % offset for offset in self._offsets))
+        self._file.write(f'trailer\n<< /Size {len(self._offsets) + 1} /Root 1 0 R >>\n'
+                         f'startxref\n{xref}\n%%EOF\n'.encode())
+        self._file.close()
+
+
+def _render_job(job):
+    number, passes, directory = job
+    page = render_page(passes)
+    if directory:
+        path = os.path.join(directory, f'page-{number:04d}.png')
+        page.save(path, dpi=(DPI, DPI))
+        return path
+    # Compressed here so the work is spread over the pool and less is sent back
+    return zlib.compress(page.tobytes())
+
+
+def write_sheets(passes, out, workers=None):
+    """Render (roll_number, name, token) rows to `out`, a .pdf file or a PNG directory; returns the page count"""
+    to_pdf = out.lower().endswith('.pdf')
+    directory = None if to_pdf else out
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    jobs = [(number, passes[i:i + PER_PAGE], directory)
+            for number, i in enumerate(range(0, len(passes), PER_PAGE), 1)]
+    if not jobs:
+        return 0
+    pdf = PdfPageWriter(out, PAGE_SIZE, DPI) if to_pdf else None
+    try:
+        with get_context('spawn').Pool(workers) as pool:
+            for result in pool.imap(_render_job, jobs):
+                if pdf:
+                    pdf.add_page(result)
+    finally:
+        if pdf:
+            pdf.close()
+    return len(jobs)
@@ -0,0 +1,89 @@
+"""
+Daily rollover of finished passes into lunch_pass_archive
+
+lunch_pass is what every scan, issue and dashboard read touches, so it
+should only hold what can still change: today's passes and passes not yet
+used. Once a meal day is over, its redeemed passes (and signed passes
+past their expiry, which can never be redeemed) are moved to
+lunch_pass_archive, keeping their ids.
+
+Rows go over in batches of `batch_size`, each an INSERT ... SELECT and a
+DELETE in one short transaction, so a scanner waits at most one batch for
+the write lock; `pause` seconds between batches leaves room for them
+during a long catch-up. The stats counters are unchanged, as the archive
+counts into them through its own triggers. Safe to interrupt and re-run.
+"""
+
+import time
+from datetime import datetime
+
+from sqlalchemy import and_, false, func, insert, literal, or_, select
+
+import signed_pass
+from models import LunchPass, LunchPassArchive
+
+ARCHIVED_COLUMNS = ('id', 'student_id', 'token', 'generated_at', 'used', 'used_at')
+
+
+def meal_day_start(now=None):
+    """Midnight (UTC, like generated_at) starting the current meal day"""
+    return (now or datetime.utcnow()).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def finished_passes(before, now=None):
+    """Condition for passes generated before `before` that can no longer be redeemed"""
+    expired = and_(
+        LunchPass.used == false(),
+        LunchPass.token.startswith(f'{signed_pass.PREFIX}.'),
+        LunchPass.generated_at < (now or datetime.utcnow()) - signed_pass.pass_ttl(),
+    )
+    return and_(
+        LunchPass.generated_at < before,
+        or_(LunchPass.used, expired),
+        # SQLite hands out max(id) + 1 for new rows, so the newest row stays
+        # put and ids are never reused for passes that would collide in the archive
+        LunchPass.id < select(func.max(LunchPass.id)).scalar_subquery(),
+    )
+
+
+def rollover_passes(session, before=None, batch_size=1000, pause=0.0, progress=None):
+    """Move finished passes generated before `before` (default: today's meal day start) to the archive
+
+    Returns counts and timings; `progress(moved)` is called after each batch.
+    """
+    started = time.perf_counter()
+    before = before or meal_day_start()
+    moved = batches = 0
+    while True:
+        archived_at = datetime.utcnow()
+        ids = session.execute(
+            select(LunchPass.id).where(finished_passes(before, archived_at)).order_by(LunchPass.id).limit(batch_size)
+        ).scalars().all()
+        if not ids:
+            break
+        columns = [getattr(LunchPass, name) for name in ARCHIVED_COLUMNS]
+        session.execute(
+            insert(LunchPassArchive).from_select(
+                [*ARCHIVED_COLUMNS, 'archived_at'],
+                select(*columns, literal(archived_at, LunchPassArchive.archived_at.type)).where(LunchPass.id.in_(ids)),
+            )
+        )
+        session.execute(LunchPass.__table__.delete().where(LunchPass.id.in_(ids)))
+        session.commit()
+        moved += len(ids)
+        batches += 1
+        if progress:
+            progress(moved)
+        if len(ids) < batch_size:
+            break
+        if pause:
+            time.sleep(pause)
+    seconds = time.perf_counter() - started
+    return {
+        'before': before.isoformat(),
+        'moved': moved,
+        'batches': batches,
+        'live_passes': session.execute(select(func.count(LunchPass.id))).scalar(),
+        'seconds': round(seconds, 3),
+        'rows_per_second': round(moved / seconds) if seconds else None,
+    }
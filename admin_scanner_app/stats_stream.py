@@ -0,0 +1,95 @@
+"""
+Server-Sent Events fan-out for the live dashboard
+
+Passes are issued by the student app and redeemed by any scanner worker,
+so changes are picked up by one background thread per process that reads
+the stats counters (a primary-key read) a few times a second while anyone
+is listening. Each change is pushed to every connected dashboard as a
+delta of the fields that moved, which also coalesces bursts to at most
+one update per poll interval.
+
+Each open stream holds a server thread for as long as the page is open,
+and scanners share those threads, so a process serves at most
+`max_streams` at once; past that stream() returns None, the app answers
+503 and the page falls back to polling /api/stats.
+"""
+
+import json
+import logging
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+
+class StatsBroadcaster:
+    def __init__(self, read_stats, interval=0.25, heartbeat=15.0, max_streams=4):
+        self._read_stats = read_stats
+        self._interval = interval
+        self._heartbeat = heartbeat
+        self._max_streams = max_streams
+        self._changed = threading.Condition()
+        self._snapshot = None
+        self._version = 0
+        self._listeners = 0
+        self._thread = None
+
+    def _poll(self):
+        while True:
+            with self._changed:
+                while not self._listeners:
+                    self._changed.wait()
+            try:
+                stats = self._read_stats()
+            except Exception:
+                log.exception('Reading stats for the dashboard stream failed')
+                stats = None
+            if stats is not None and stats != self._snapshot:
+                with self._changed:
+                    self._snapshot = stats
+                    self._version += 1
+                    self._changed.notify_all()
+            time.sleep(self._interval)
+
+    def _wait_for_change(self, seen_version):
+        """Block until there is a snapshot newer than `seen_version` or the heartbeat is due"""
+        deadline = time.monotonic() + self._heartbeat
+        with self._changed:
+            while self._version == seen_version:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return seen_version, None
+                self._changed.wait(remaining)
+            return self._version, self._snapshot
+
+    def stream(self):
+        """Generator of SSE frames for one client (a full snapshot, then deltas), or None when full"""
+        with self._changed:
+            if self._listeners >= self._max_streams:
+                return None
+            self._listeners += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._poll, name='stats-stream', daemon=True)
+                self._thread.start()
+            self._changed.notify_all()
+        frames = self._frames()
+        next(frames)  # started, so closing it frees the slot even if no frame is ever sent
+        return frames
+
+    def _frames(self):
+        try:
+            yield None
+            yield 'retry: 2000\n\n'
+            sent, version = {}, 0
+            while True:
+                version, snapshot = self._wait_for_change(version)
+                if snapshot is None:
+                    yield ': keep-alive\n\n'
+                    continue
+                delta = {key: value for key, value in snapshot.items() if sent.get(key) != value}
+                if delta:
+                    sent = snapshot
+                    yield f'data: {json.dumps(delta)}\n\n'
+        finally:
+            with self._changed:
+                self._listeners -= 1
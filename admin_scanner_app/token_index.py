@@ -0,0 +1,167 @@
+"""
+In-memory index of issued pass tokens
+
+Each scanner worker keeps a Bloom filter of every token ever issued, live
+or rolled over into the archive, so a scan of a known token goes straight
+to redemption while a pass redeemed on an earlier day still reaches the
+database and is answered "already used". A Bloom filter never says no to
+a token it holds and says yes to one it doesn't at about `error_rate`, for
+a few bytes per pass however long the tokens are.
+
+Passes are issued by the student app in another process, so a miss is
+never taken on the filter's word. At most once per refresh interval it
+first pulls in the rows added since the last one seen, re-reading an
+overlap of REFRESH_OVERLAP ids below it (ids from a PostgreSQL sequence
+can commit out of order); a token still missing is then looked up by its
+unique index, and only rejected when the database has no such pass. Once
+more passes are issued than the filter was sized for, it is rebuilt twice
+as large.
+"""
+
+import hashlib
+import math
+import threading
+import time
+from datetime import datetime
+
+MIN_CAPACITY = 100_000
+REFRESH_OVERLAP = 1000
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.bits = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.bits / capacity * math.log(2)))
+        self.count = 0
+        self._array = bytearray((self.bits + 7) // 8)
+
+    def _positions(self, token):
+        # Two 64-bit halves of one digest, combined as Kirsch-Mitzenmacher double hashing
+        digest = hashlib.blake2b(token.encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.bits for i in range(self.hashes)]
+
+    def add(self, token):
+        for position in self._positions(token):
+            self._array[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, token):
+        return all(self._array[position >> 3] & (1 << (position & 7)) for position in self._positions(token))
+
+    @property
+    def memory_bytes(self):
+        return len(self._array)
+
+    def expected_error_rate(self):
+        """False-positive rate for the tokens added so far"""
+        return (1 - math.exp(-self.hashes * self.count / self.bits)) ** self.hashes
+
+
+class TokenIndex:
+    def __init__(self, count_issued, load_issued, load_newer, lookup, refresh_interval=0.5, error_rate=0.001):
+        """
+        `count_issued()` is roughly how many passes were ever issued (to size the filter),
+        `load_issued()` yields (id, token) of each of them for the full rebuild,
+        `load_newer(after_id)` returns the rows with a larger id and
+        `lookup(token)` returns the id of the pass carrying `token`, or None.
+        """
+        self._count_issued = count_issued
+        self._load_issued = load_issued
+        self._load_newer = load_newer
+        self._lookup = lookup
+        self._refresh_interval = refresh_interval
+        self._error_rate = error_rate
+        self._lock = threading.Lock()
+        self._filter = None
+        self._last_id = 0
+        self._refreshed_at = 0.0
+        self._rebuild_seconds = None
+        self._rebuilt_at = None
+        self._lookups = 0
+        self._rejected = 0
+        self._database_lookups = 0
+        self._hits = 0
+        self._false_positives = 0
+
+    def rebuild(self):
+        """Load every issued token; done at startup and when the filter outgrows its capacity"""
+        started = time.perf_counter()
+        bloom = BloomFilter(max(MIN_CAPACITY, 2 * (self._count_issued() or 0)), self._error_rate)
+        last_id = 0
+        for pass_id, token in self._load_issued():
+            bloom.add(token)
+            last_id = max(last_id, pass_id)
+        with self._lock:
+            self._filter = bloom
+            self._last_id = last_id
+            self._refreshed_at = time.monotonic()
+            self._rebuild_seconds = time.perf_counter() - started
+            self._rebuilt_at = datetime.utcnow()
+
+    def refresh(self):
+        """Add passes issued since the last rebuild or refresh, and any committed late below it"""
+        if self._filter is None:
+            return self.rebuild()
+        with self._lock:
+            after_id = max(self._last_id - REFRESH_OVERLAP, 0)
+        rows = self._load_newer(after_id)
+        with self._lock:
+            for pass_id, token in rows:
+                self._add(pass_id, token)
+            self._refreshed_at = time.monotonic()
+            full = self._filter.count > self._filter.capacity
+        if full:
+            self.rebuild()
+
+    def _add(self, pass_id, token):
+        # Overlapping refreshes see rows twice; count each token once
+        if token not in self._filter:
+            self._filter.add(token)
+        self._last_id = max(self._last_id, pass_id)
+
+    def might_contain(self, token):
+        """False means the database has no pass with this token"""
+        if self._filter is None:
+            self.rebuild()
+        self._lookups += 1
+        if token in self._filter:
+            self._hits += 1
+            return True
+        if time.monotonic() - self._refreshed_at >= self._refresh_interval:
+            self.refresh()
+            if token in self._filter:
+                self._hits += 1
+                return True
+        self._database_lookups += 1
+        pass_id = self._lookup(token)
+        if pass_id is not None:
+            with self._lock:
+                self._add(pass_id, token)
+            self._hits += 1
+            return True
+        self._rejected += 1
+        return False
+
+    def record_false_positive(self):
+        """The index said yes but the database has no such pass"""
+        self._false_positives += 1
+
+    def stats(self):
+        bloom = self._filter
+        return {
+            'size': bloom.count if bloom else 0,
+            'capacity': bloom.capacity if bloom else 0,
+            'memory_bytes': bloom.memory_bytes if bloom else 0,
+            'hash_functions': bloom.hashes if bloom else 0,
+            'expected_false_positive_rate': round(bloom.expected_error_rate(), 6) if bloom else 0.0,
+            'last_pass_id': self._last_id,
+            'lookups': self._lookups,
+            'database_lookups': self._database_lookups,
+            'rejected': self._rejected,
+            'false_positives': self._false_positives,
+            'false_positive_rate': round(self._false_positives / self._hits, 6) if self._hits else 0.0,
+            'rebuild_seconds': self._rebuild_seconds,
+            'rebuilt_at': self._rebuilt_at.isoformat() if self._rebuilt_at else None,
+        }
@@ -0,0 +1,91 @@
+"""
+Write-behind queue for signed pass redemptions
+
+With DEFER_REDEMPTION=1 the scanner admits a verified signed pass after a
+single indexed read and the "mark used" UPDATE is flushed to the database
+in batches by a background thread. The read catches passes redeemed before
+a restart; duplicate scans since are caught by an in-process set of
+redeemed pass ids, which other processes can't see for up to one flush
+interval, so the app refuses this mode under more than one worker process.
+"""
+
+import argparse
+import atexit
+import logging
+import os
+import shlex
+import sys
+import threading
+import time
+from datetime import datetime
+
+log = logging.getLogger(__name__)
+
+
+def configured_workers():
+    """Worker processes gunicorn was asked for (its command line, GUNICORN_CMD_ARGS or WEB_CONCURRENCY); 1 otherwise"""
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument('-w', '--workers', type=int)
+    args = shlex.split(os.getenv('GUNICORN_CMD_ARGS', ''))
+    if os.path.basename(sys.argv[0]).startswith('gunicorn'):
+        args += sys.argv[1:]  # later flags win, as the command line overrides GUNICORN_CMD_ARGS
+    workers = parser.parse_known_args(args)[0].workers
+    return workers or int(os.getenv('WEB_CONCURRENCY', '1'))
+
+
+class RedemptionQueue:
+    def __init__(self, flush, interval=0.5):
+        """`flush(items)` persists a list of (token, used_at) and returns the tokens it could not redeem"""
+        self._flush = flush
+        self._interval = interval
+        self._lock = threading.Lock()
+        self._pending = []
+        self._redeemed = {}  # pass id -> pass expiry, pruned once expired
+        self._thread = None
+
+    def submit(self, token, claims, used_at, used_in_database):
+        """Queue a redemption; False if this pass was already redeemed, here or in the database
+
+        `used_in_database` is read by the caller, outside this queue's lock,
+        so one slow read doesn't hold up every other scan.
+        """
+        if used_in_database:
+            return False
+        with self._lock:
+            if claims.pass_id in self._redeemed:
+                return False
+            self._redeemed[claims.pass_id] = claims.expires_at
+            self._pending.append((token, used_at))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='redemption-flush', daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+        return True
+
+    def flush(self):
+        """Write out everything queued so far"""
+        with self._lock:
+            items, self._pending = self._pending, []
+            now = datetime.utcnow()
+            self._redeemed = {pid: exp for pid, exp in self._redeemed.items() if exp > now}
+        if not items:
+            return []
+        try:
+            return self._flush(items)
+        except Exception:
+            # Keep the scans for the next attempt rather than losing them
+            with self._lock:
+                self._pending[:0] = items
+            raise
+
+    def stats(self):
+        with self._lock:
+            return {'pending': len(self._pending), 'tracked_passes': len(self._redeemed)}
+
+    def _run(self):
+        while True:
+            time.sleep(self._interval)
+            try:
+                self.flush()
+            except Exception:
+                log.exception('Deferred redemption flush failed, will retry')
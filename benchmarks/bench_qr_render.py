@@ -0,0 +1,84 @@
+"""
+QR renders per second, per format
+
+Compares the old inline path (qrcode's PIL image factory, PNG, base64) with
+qr_render's PNG and SVG output, uncached and from the LRU cache, for random
+and signed pass tokens.
+
+    python benchmarks/bench_qr_render.py [--seconds 2]
+"""
+
+import argparse
+import base64
+import io
+import os
+import secrets
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import qrcode
+
+import qr_render
+import signed_pass
+
+
+def legacy_inline_png(token):
+    qr = qrcode.QRCode(version=1, box_size=10, border=5)
+    qr.add_data(token)
+    qr.make(fit=True)
+    img = qr.make_image(fill_color="black", back_color="white")
+    img_io = io.BytesIO()
+    img.save(img_io, 'PNG')
+    return base64.b64encode(img_io.getvalue())
+
+
+def uncached(fmt):
+    return lambda token: qr_render.RENDERERS[fmt](qr_render.qr_matrix(token))
+
+
+def cached(fmt):
+    return lambda token: qr_render.render(token, fmt)
+
+
+def measure(render, tokens, seconds):
+    count, started = 0, time.perf_counter()
+    while time.perf_counter() - started < seconds:
+        render(tokens[count % len(tokens)])
+        count += 1
+    return count / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=2.0)
+    parser.add_argument('--tokens', type=int, default=200)
+    args = parser.parse_args()
+
+    key = secrets.token_bytes(32)
+    token_sets = {
+        'random': [secrets.token_urlsafe(32) for _ in range(args.tokens)],
+        'signed': [signed_pass.issue(i, key) for i in range(1, args.tokens + 1)],
+    }
+    renderers = {
+        'legacy png+base64': legacy_inline_png,
+        'png': uncached('png'),
+        'svg': uncached('svg'),
+        'png (cached)': cached('png'),
+        'svg (cached)': cached('svg'),
+    }
+
+    for kind, tokens in token_sets.items():
+        print(f'\n{kind} tokens ({len(tokens[0])} chars):')
+        for label, render in renderers.items():
+            qr_render.render.cache_clear()
+            if label.endswith('(cached)'):
+                for token in tokens:
+                    render(token)
+            rate = measure(render, tokens, args.seconds)
+            print(f'  {label:<20} {rate:12,.0f} renders/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""
+Query plans before and after the index migrations
+
+Seeds a throwaway SQLite database with a synthetic roster and pass history
+at the baseline schema (migration 1), prints EXPLAIN QUERY PLAN and timings
+for the hot queries, then upgrades to the latest migration and repeats.
+
+    python benchmarks/bench_query_plans.py [--students 10000] [--passes 1000000]
+"""
+
+import argparse
+import os
+import random
+import secrets
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sqlalchemy as sa
+
+import migrations
+from models import db
+
+QUERIES = {
+    'active pass for student': (
+        'SELECT id, token FROM lunch_pass WHERE student_id = :student_id AND used = 0 LIMIT 1',
+        lambda n: {'student_id': random.randint(1, n)},
+    ),
+    'pass by token': (
+        'SELECT id, used FROM lunch_pass WHERE token = :token',
+        lambda n: {'token': 'missing-' + secrets.token_urlsafe(8)},
+    ),
+    'recent activity': (
+        'SELECT id, student_id, generated_at, used FROM lunch_pass ORDER BY generated_at DESC LIMIT 10',
+        lambda n: {},
+    ),
+    'passes of one student': (
+        'SELECT COUNT(*), SUM(used) FROM lunch_pass WHERE student_id = :student_id',
+        lambda n: {'student_id': random.randint(1, n)},
+    ),
+}
+
+
+def seed(engine, students, passes):
+    started = time.perf_counter()
+    raw = engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        cursor.executemany(
+            'INSERT INTO student (id, roll_number, name) VALUES (?, ?, ?)',
+            ((i, f'R{i:06d}', f'Student {i}') for i in range(1, students + 1)),
+        )
+        start = datetime(2026, 1, 1)
+        cursor.executemany(
+            'INSERT INTO lunch_pass (student_id, token, generated_at, used, used_at) VALUES (?, ?, ?, ?, ?)',
+            (
+                (
+                    random.randint(1, students),
+                    f'T{i:08d}{secrets.token_hex(4)}',
+                    (start + timedelta(seconds=i * 10)).isoformat(' '),
+                    0 if i % 50 == 0 else 1,
+                    None if i % 50 == 0 else (start + timedelta(seconds=i * 10 + 300)).isoformat(' '),
+                )
+                for i in range(passes)
+            ),
+        )
+        raw.commit()
+    finally:
+        raw.close()
+    print(f'Seeded {students} students / {passes} passes in {time.perf_counter() - started:.1f}s')
+
+
+def report(engine, students, repeats):
+    with engine.connect() as conn:
+        conn.exec_driver_sql('ANALYZE')
+        for label, (sql, params) in QUERIES.items():
+            plan = conn.execute(sa.text('EXPLAIN QUERY PLAN ' + sql), params(students)).all()
+            started = time.perf_counter()
+            for _ in range(repeats):
+                conn.execute(sa.text(sql), params(students)).all()
+            per_query = (time.perf_counter() - started) / repeats * 1000
+            print(f'  {label:<26} {per_query:9.3f} ms  ' + ' | '.join(row[-1] for row in plan))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--students', type=int, default=10_000)
+    parser.add_argument('--passes', type=int, default=1_000_000)
+    parser.add_argument('--repeats', type=int, default=50)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    engine = sa.create_engine(f'sqlite:///{path}')
+    migrations.upgrade(engine, db.metadata, target=1)
+    seed(engine, args.students, args.passes)
+
+    print('\nBefore (baseline schema):')
+    report(engine, args.students, args.repeats)
+
+    started = time.perf_counter()
+    applied = migrations.upgrade(engine, db.metadata)
+    print(f'\nApplied migrations {applied} in {time.perf_counter() - started:.1f}s')
+
+    print('\nAfter:')
+    report(engine, args.students, args.repeats)
+    engine.dispose()
+    os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
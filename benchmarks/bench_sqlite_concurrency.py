@@ -0,0 +1,145 @@
+"""
+Scans per second against SQLite with concurrent writer processes
+
+Runs the same workload twice, each on a fresh database: once through a
+plain create_engine() (SQLite defaults: rollback journal, synchronous=FULL)
+and once through db_engine.create_engine() (WAL, busy_timeout,
+synchronous=NORMAL, ...). Half of the N processes redeem passes with the
+scanner's single conditional UPDATE, the other half issue new passes the
+way the student app does; every statement commits on its own.
+
+    python benchmarks/bench_sqlite_concurrency.py [--writers 1 2 4 8] [--seconds 5] [--dir DIR]
+
+Point --dir at the disk the real database lives on; on tmpfs fsync is free
+and synchronous=NORMAL makes little difference.
+"""
+
+import argparse
+import multiprocessing
+import os
+import secrets
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sqlalchemy as sa
+from sqlalchemy.exc import OperationalError
+
+import db_engine
+import migrations
+from models import db
+
+STUDENTS = 20_000
+
+REDEEM = sa.text(
+    'UPDATE lunch_pass SET used = 1, used_at = :now WHERE token = :token AND used = 0 RETURNING id'
+)
+ISSUE = sa.text(
+    'INSERT INTO lunch_pass (student_id, token, generated_at, used) VALUES (:student_id, :token, :now, 0) '
+    'ON CONFLICT DO NOTHING'
+)
+
+
+def make_engine(url, tuned):
+    return db_engine.create_engine(url) if tuned else sa.create_engine(url)
+
+
+def seed(url, tuned):
+    engine = make_engine(url, tuned)
+    migrations.upgrade(engine, db.metadata)
+    with engine.begin() as conn:
+        conn.execute(sa.text('INSERT INTO student (id, roll_number, name) VALUES (:id, :roll, :name)'), [
+            {'id': i, 'roll': f'R{i:06d}', 'name': f'Student {i}'} for i in range(1, STUDENTS + 1)
+        ])
+        # Scanners redeem passes of the first half of the roster; issuers serve the second half
+        tokens = [f'T{i:06d}-{secrets.token_hex(8)}' for i in range(1, STUDENTS // 2 + 1)]
+        conn.execute(ISSUE, [
+            {'student_id': i, 'token': token, 'now': datetime.utcnow()} for i, token in enumerate(tokens, 1)
+        ])
+    engine.dispose()
+    return tokens
+
+
+def worker(url, tuned, role, work, seconds, start, results):
+    engine = make_engine(url, tuned)
+    done = errors = 0
+    start.wait()
+    deadline = time.perf_counter() + seconds
+    for item in work:
+        if time.perf_counter() >= deadline:
+            break
+        try:
+            with engine.begin() as conn:
+                if role == 'scan':
+                    conn.execute(REDEEM, {'token': item, 'now': datetime.utcnow()}).first()
+                else:
+                    conn.execute(ISSUE, {'student_id': item, 'token': secrets.token_urlsafe(32),
+                                         'now': datetime.utcnow()})
+            done += 1
+        except OperationalError:  # "database is locked"
+            errors += 1
+    results.put((role, done, errors))
+    engine.dispose()
+
+
+def run(directory, writers, seconds, tuned):
+    path = os.path.join(directory, f"bench-{'tuned' if tuned else 'default'}-{writers}.db")
+    url = f'sqlite:///{path}'
+    tokens = seed(url, tuned)
+    issue_ids = list(range(STUDENTS // 2 + 1, STUDENTS + 1))
+
+    context = multiprocessing.get_context('spawn')
+    start, results = context.Event(), context.Queue()
+    scanners = max(writers // 2, 1)
+    issuers = writers - scanners
+    processes = [
+        context.Process(target=worker, args=(url, tuned, 'scan', tokens[i::scanners], seconds, start, results))
+        for i in range(scanners)
+    ] + [
+        context.Process(target=worker, args=(url, tuned, 'issue', issue_ids[i::issuers], seconds, start, results))
+        for i in range(issuers)
+    ]
+    for process in processes:
+        process.start()
+    time.sleep(1.0)  # let every process import and connect
+    start.set()
+    totals = {'scan': [0, 0], 'issue': [0, 0]}
+    for _ in processes:
+        role, done, errors = results.get()
+        totals[role][0] += done
+        totals[role][1] += errors
+    for process in processes:
+        process.join()
+    for suffix in ('', '-wal', '-shm', '-journal'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--writers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--dir', help='Where to create the databases (default: a temporary directory)')
+    args = parser.parse_args()
+
+    directory = args.dir or tempfile.mkdtemp()
+    print(f"{'writers':>7}  {'settings':<8}  {'scans/s':>9}  {'issues/s':>9}  {'locked errors':>13}")
+    try:
+        for writers in args.writers:
+            for tuned in (False, True):
+                totals = run(directory, writers, args.seconds, tuned)
+                print(f"{writers:>7}  {'tuned' if tuned else 'default':<8}  "
+                      f"{totals['scan'][0] / args.seconds:>9,.0f}  {totals['issue'][0] / args.seconds:>9,.0f}  "
+                      f"{totals['scan'][1] + totals['issue'][1]:>13}")
+    finally:
+        if not args.dir:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
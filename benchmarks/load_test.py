@@ -0,0 +1,263 @@
+"""
+Lunch-rush load test against locally launched student and scanner apps
+
+Seeds a throwaway database with a synthetic roster, pre-issues passes for
+half of it, then starts student_app and admin_scanner_app as real servers
+on that database (gunicorn if installed, otherwise Flask's threaded
+server). Simulated students POST /generate for the other half of the
+roster while simulated scanner stations POST /api/validate-token with the
+pre-issued passes, all at once from separate client processes over
+keep-alive connections.
+
+Reports per endpoint: throughput, p50/p95/p99/max latency, status codes,
+5xx responses and "database is locked" lines in the server logs. The full
+result is written as JSON so runs can be compared across changes.
+
+    python benchmarks/load_test.py [--students 10000] [--student-clients 16] [--scanner-clients 8]
+                                   [--workers 2] [--threads 8] [--seconds 30] [--out results.json]
+
+Extra app settings (SIGNED_PASSES=1, DEFER_REDEMPTION=1, ...) are passed
+through from the environment to both servers.
+"""
+
+import argparse
+import http.client
+import importlib.util
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+import sqlalchemy as sa
+
+import db_engine
+import migrations
+import signed_pass
+from models import db
+
+SIGNING_KEY = 'load-test-signing-key'
+UNKNOWN_ROLL_EVERY = 20  # one in this many student requests uses a roll number not on the roster
+LOCK_ERROR = 'database is locked'
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def seed(url, students):
+    """Roster of `students`; the first half hold pre-issued passes, whose tokens are returned"""
+    engine = db_engine.create_engine(url)
+    migrations.upgrade(engine, db.metadata)
+    key = signed_pass.signing_key()
+    with engine.begin() as conn:
+        conn.execute(sa.text('INSERT INTO student (id, roll_number, name) VALUES (:id, :roll, :name)'), [
+            {'id': i, 'roll': f'LT{i:06d}', 'name': f'Student {i}'} for i in range(1, students + 1)
+        ])
+        passes = [
+            {'student_id': i, 'token': signed_pass.new_token(i, key), 'now': datetime.utcnow()}
+            for i in range(1, students // 2 + 1)
+        ]
+        conn.execute(sa.text(
+            'INSERT INTO lunch_pass (student_id, token, generated_at, used) VALUES (:student_id, :token, :now, 0)'
+        ), passes)
+    engine.dispose()
+    rolls = [f'LT{i:06d}' for i in range(students // 2 + 1, students + 1)]
+    return rolls, [p['token'] for p in passes]
+
+
+def server_command(server, port, workers, threads):
+    if server == 'gunicorn':
+        return [sys.executable, '-m', 'gunicorn', '--bind', f'127.0.0.1:{port}', '--workers', str(workers),
+                '--threads', str(threads), '--timeout', '60', 'app:app']
+    return [sys.executable, '-m', 'flask', '--app', 'app', 'run', '--host', '127.0.0.1', '--port', str(port),
+            '--with-threads', '--no-reload', '--no-debugger']
+
+
+def start_server(app_dir, server, workers, threads, log_path):
+    port = free_port()
+    log = open(log_path, 'w')
+    process = subprocess.Popen(server_command(server, port, workers, threads), cwd=os.path.join(ROOT_DIR, app_dir),
+                               stdout=log, stderr=subprocess.STDOUT)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'{app_dir} exited during startup, see {log_path}')
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                return process, port
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f'{app_dir} did not start listening, see {log_path}')
+
+
+def client(port, path, field, items, seconds, start, results):
+    """POST {field: item} for each item in turn, recording (latency ms, status) per request"""
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    headers = {'Content-Type': 'application/json'}
+    latencies, statuses, failures = [], {}, 0
+    start.wait()
+    deadline = time.perf_counter() + seconds
+    for item in items:
+        began = time.perf_counter()
+        if began >= deadline:
+            break
+        try:
+            conn.request('POST', path, json.dumps({field: item}), headers)
+            response = conn.getresponse()
+            response.read()
+            status = response.status
+        except (OSError, http.client.HTTPException):
+            failures += 1
+            conn.close()
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+            continue
+        latencies.append((time.perf_counter() - began) * 1000)
+        statuses[status] = statuses.get(status, 0) + 1
+    conn.close()
+    results.put((path, latencies, statuses, failures))
+
+
+def percentile(ordered, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not ordered:
+        return None
+    return round(ordered[min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))], 2)
+
+
+def summarise(latencies, statuses, failures, elapsed):
+    ordered = sorted(latencies)
+    return {
+        'requests': len(ordered),
+        'throughput_per_second': round(len(ordered) / elapsed, 1) if elapsed else 0,
+        'latency_ms': {
+            'p50': percentile(ordered, 0.50),
+            'p95': percentile(ordered, 0.95),
+            'p99': percentile(ordered, 0.99),
+            'max': round(ordered[-1], 2) if ordered else None,
+        },
+        'status_codes': {str(status): count for status, count in sorted(statuses.items())},
+        'server_errors': sum(count for status, count in statuses.items() if status >= 500),
+        'connection_failures': failures,
+    }
+
+
+def count_lock_errors(log_path):
+    with open(log_path, errors='replace') as log:
+        return sum(line.count(LOCK_ERROR) for line in log)
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--students', type=int, default=10_000)
+    parser.add_argument('--student-clients', type=int, default=16)
+    parser.add_argument('--scanner-clients', type=int, default=8)
+    parser.add_argument('--server', choices=['auto', 'gunicorn', 'flask'], default='auto')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn workers per app')
+    parser.add_argument('--threads', type=int, default=8, help='gunicorn threads per worker')
+    parser.add_argument('--seconds', type=float, default=30.0, help='Stop clients after this long')
+    parser.add_argument('--dir', help='Where to create the database and server logs (default: a temporary directory)')
+    parser.add_argument('--out', default='load_test_results.json')
+    args = parser.parse_args()
+
+    server = args.server
+    if server == 'auto':
+        server = 'gunicorn' if importlib.util.find_spec('gunicorn') else 'flask'
+
+    directory = args.dir or tempfile.mkdtemp()
+    url = f"sqlite:///{os.path.join(directory, 'load_test.db')}"
+    os.environ.update(DATABASE_URL=url, PASS_SIGNING_KEY=os.getenv('PASS_SIGNING_KEY', SIGNING_KEY))
+
+    print(f'Seeding {args.students:,} students in {directory} ...')
+    rolls, tokens = seed(url, args.students)
+    unknown = [f'NOPE{i:06d}' for i in range(len(rolls) // UNKNOWN_ROLL_EVERY)]
+    rolls = rolls + unknown
+
+    servers = []
+    try:
+        print(f'Starting both apps with {server} ...')
+        for app_dir in ('student_app', 'admin_scanner_app'):
+            log_path = os.path.join(directory, f'{app_dir}.log')
+            servers.append((app_dir, log_path, *start_server(app_dir, server, args.workers, args.threads, log_path)))
+        (_, _, _, student_port), (_, _, _, scanner_port) = servers
+
+        context = multiprocessing.get_context('spawn')
+        start, results = context.Event(), context.Queue()
+        plan = [
+            (student_port, '/generate', 'roll_number', rolls, args.student_clients),
+            (scanner_port, '/api/validate-token', 'token', tokens, args.scanner_clients),
+        ]
+        clients = [
+            context.Process(target=client, args=(port, path, field, items[i::count], args.seconds, start, results))
+            for port, path, field, items, count in plan
+            for i in range(count)
+        ]
+        for process in clients:
+            process.start()
+        time.sleep(1.0)  # let every client import and connect
+        print(f'Running {args.student_clients} students and {args.scanner_clients} scanners ...')
+        began = time.perf_counter()
+        start.set()
+        collected = {path: ([], {}, 0) for _, path, _, _, _ in plan}
+        for _ in clients:
+            path, latencies, statuses, failures = results.get()
+            all_latencies, all_statuses, all_failures = collected[path]
+            all_latencies.extend(latencies)
+            for status, count in statuses.items():
+                all_statuses[status] = all_statuses.get(status, 0) + count
+            collected[path] = (all_latencies, all_statuses, all_failures + failures)
+        elapsed = time.perf_counter() - began
+        for process in clients:
+            process.join()
+    finally:
+        for _, _, process, _ in servers:
+            process.terminate()
+            process.wait(timeout=30)
+
+    report = {
+        'started_at': datetime.utcnow().isoformat(timespec='seconds'),
+        'revision': git_revision(),
+        'host': {'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count()},
+        'settings': {**vars(args), 'server': server},
+        'elapsed_seconds': round(elapsed, 2),
+        'endpoints': {path: summarise(*collected[path], elapsed) for path in collected},
+        'db_lock_errors': {app_dir: count_lock_errors(log_path) for app_dir, log_path, _, _ in servers},
+    }
+    with open(args.out, 'w') as out:
+        json.dump(report, out, indent=2)
+
+    print(f"\n{'endpoint':<22}  {'req/s':>8}  {'p50 ms':>8}  {'p95 ms':>8}  {'p99 ms':>8}  {'5xx':>5}  statuses")
+    for path, summary in report['endpoints'].items():
+        latency = summary['latency_ms']
+        print(f"{path:<22}  {summary['throughput_per_second']:>8,.1f}  {latency['p50'] or 0:>8.2f}  "
+              f"{latency['p95'] or 0:>8.2f}  {latency['p99'] or 0:>8.2f}  {summary['server_errors']:>5}  "
+              f"{summary['status_codes']}")
+    print(f"'{LOCK_ERROR}' in server logs: {report['db_lock_errors']}")
+    print(f'Results written to {args.out}')
+
+    if not args.dir:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,244 @@
+"""
+Concurrency torture test for double redemption and duplicate issuance
+
+Seeds a throwaway database (half the roster holding pre-issued passes),
+launches student_app and admin_scanner_app on it like load_test.py, then
+has every client process fire *the same* tokens and roll numbers, each in
+its own shuffled order, so every token and every roll number is raced by
+all of them at once:
+
+1. every pre-issued token at /api/validate-token, every roll number
+   without a pass at /generate, and, from --direct processes, the same
+   tokens redeemed straight against the database the way a second
+   scanner host on the shared canteen_data.db would;
+2. every pass handed out in round 1, scanned by all clients again.
+
+Then it checks the invariants and exits non-zero if any is broken:
+
+- each token was accepted exactly once, and is marked used
+- no student holds more than one unused pass
+- every /generate answer for a roll number named the same pass
+- the trigger-maintained stats counters match COUNT(*)
+- no request failed with a 5xx
+
+    python benchmarks/stress_invariants.py [--students 400] [--clients 8] [--direct 2] [--out stress.json]
+
+App settings such as SIGNED_PASSES or DEFER_REDEMPTION are passed through
+from the environment, so each mode can be run under the same torture
+(the scanner refuses DEFER_REDEMPTION=1 under gunicorn unless --workers 1).
+"""
+
+import argparse
+import http.client
+import importlib.util
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sqlalchemy as sa
+
+import db_engine
+import migrations
+import repository
+from load_test import SIGNING_KEY, seed, start_server
+
+SHOW_VIOLATIONS = 10
+
+
+def race(scanner_port, student_port, url, tokens, rolls, seed_value, start, results):
+    """Redeem every token and request a pass for every roll number, in an order of our own
+
+    With scanner_port None, tokens are redeemed directly against the database.
+    """
+    order = [('scan', token) for token in tokens] + [('issue', roll) for roll in rolls]
+    random.Random(seed_value).shuffle(order)
+    headers = {'Content-Type': 'application/json'}
+    connections = {}
+    engine = db_engine.create_engine(url) if scanner_port is None else None
+
+    def post(port, path, body):
+        if port not in connections:
+            connections[port] = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        conn = connections[port]
+        try:
+            conn.request('POST', path, json.dumps(body), headers)
+            response = conn.getresponse()
+            return response.status, json.loads(response.read() or b'{}')
+        except (OSError, http.client.HTTPException, ValueError):
+            conn.close()
+            connections.pop(port, None)
+            return None, {}
+
+    accepted, issued, statuses = [], [], Counter()
+    start.wait()
+    for kind, item in order:
+        if kind == 'scan' and engine is not None:
+            with engine.begin() as conn:
+                ok = repository.redeem_token(conn, item) is not None
+            statuses['direct'] += 1
+            if ok:
+                accepted.append(item)
+        elif kind == 'scan':
+            status, _ = post(scanner_port, '/api/validate-token', {'token': item})
+            statuses[status] += 1
+            if status == 200:
+                accepted.append(item)
+        elif student_port is not None:
+            status, body = post(student_port, '/generate', {'roll_number': item})
+            statuses[status] += 1
+            if status == 200:
+                issued.append((item, body['token']))
+    for conn in connections.values():
+        conn.close()
+    if engine is not None:
+        engine.dispose()
+    results.put((accepted, issued, dict(statuses)))
+
+
+def run_round(context, clients, direct, ports, url, tokens, rolls, round_number):
+    """One race among all clients; returns (accepted token counts, {roll: tokens}, statuses, seconds)"""
+    start, results = context.Event(), context.Queue()
+    student_port, scanner_port = ports
+    processes = [
+        context.Process(target=race, args=(scanner_port, student_port, url, tokens, rolls,
+                                           round_number * 1000 + i, start, results))
+        for i in range(clients)
+    ] + [
+        context.Process(target=race, args=(None, None, url, tokens, [], round_number * 1000 + clients + i,
+                                           start, results))
+        for i in range(direct)
+    ]
+    for process in processes:
+        process.start()
+    time.sleep(1.0)  # let every client import and connect
+    began = time.perf_counter()
+    start.set()
+    accepted, issued, statuses = Counter(), defaultdict(set), Counter()
+    for _ in processes:
+        process_accepted, process_issued, process_statuses = results.get()
+        accepted.update(process_accepted)
+        for roll, token in process_issued:
+            issued[roll].add(token)
+        statuses.update({str(status): count for status, count in process_statuses.items()})
+    elapsed = time.perf_counter() - began
+    for process in processes:
+        process.join()
+    return accepted, issued, statuses, elapsed
+
+
+def check(url, tokens, accepted, issued, statuses):
+    """{invariant: [violations]} for every invariant that does not hold"""
+    violations = defaultdict(list)
+    for token in tokens:
+        if accepted[token] != 1:
+            violations['token accepted exactly once'].append(f'{token}: accepted {accepted[token]} times')
+    for roll, handed_out in issued.items():
+        if len(handed_out) > 1:
+            violations['one pass per roll number'].append(f'{roll}: handed {len(handed_out)} different passes')
+    for status, count in statuses.items():
+        if status == 'None' or status.startswith('5'):
+            violations['no failed requests'].append(f'{count} requests answered {status}')
+
+    engine = db_engine.create_engine(url)
+    with engine.connect() as conn:
+        unused = conn.execute(sa.text('SELECT token FROM lunch_pass WHERE used = 0 AND token IN :tokens')
+                              .bindparams(sa.bindparam('tokens', expanding=True)), {'tokens': list(tokens)}).scalars()
+        violations['accepted tokens are used'].extend(f'{token}: still unused' for token in unused)
+        doubled = conn.execute(sa.text(
+            'SELECT student_id, COUNT(*) FROM lunch_pass WHERE used = 0 GROUP BY student_id HAVING COUNT(*) > 1'
+        )).all()
+        violations['at most one unused pass per student'].extend(
+            f'student {student_id}: {count} unused passes' for student_id, count in doubled
+        )
+        counters = dict(conn.execute(sa.text('SELECT name, value FROM stats_counter')).all())
+        for name, count_sql in migrations.TOTAL_STATS_COUNTERS.items():
+            counted = conn.exec_driver_sql(count_sql).scalar()
+            if counters.get(name) != counted:
+                violations['stats counters match COUNT(*)'].append(f'{name}: {counters.get(name)} != {counted}')
+    engine.dispose()
+    return {name: found for name, found in violations.items() if found}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--students', type=int, default=400)
+    parser.add_argument('--clients', type=int, default=8, help='HTTP client processes, each racing every item')
+    parser.add_argument('--direct', type=int, default=2, help='Processes redeeming straight against the database')
+    parser.add_argument('--server', choices=['auto', 'gunicorn', 'flask'], default='auto')
+    parser.add_argument('--workers', type=int, default=4, help='gunicorn workers per app')
+    parser.add_argument('--threads', type=int, default=4, help='gunicorn threads per worker')
+    parser.add_argument('--dir', help='Where to create the database and server logs (default: a temporary directory)')
+    parser.add_argument('--out', help='Also write the results as JSON here')
+    args = parser.parse_args()
+
+    server = args.server
+    if server == 'auto':
+        server = 'gunicorn' if importlib.util.find_spec('gunicorn') else 'flask'
+
+    directory = args.dir or tempfile.mkdtemp()
+    url = f"sqlite:///{os.path.join(directory, 'stress.db')}"
+    os.environ.update(DATABASE_URL=url, PASS_SIGNING_KEY=os.getenv('PASS_SIGNING_KEY', SIGNING_KEY))
+
+    rolls, tokens = seed(url, args.students)
+    servers = []
+    try:
+        for app_dir in ('student_app', 'admin_scanner_app'):
+            log_path = os.path.join(directory, f'{app_dir}.log')
+            servers.append(start_server(app_dir, server, args.workers, args.threads, log_path))
+        ports = tuple(port for _, port in servers)
+        context = multiprocessing.get_context('spawn')
+
+        print(f'Round 1: {args.clients} clients + {args.direct} direct racing {len(tokens)} tokens '
+              f'and {len(rolls)} roll numbers on {server} ...')
+        accepted, issued, statuses, first = run_round(context, args.clients, args.direct, ports, url,
+                                                      tokens, rolls, 1)
+        fresh = sorted({token for handed_out in issued.values() for token in handed_out})
+        print(f'Round 2: racing the {len(fresh)} passes handed out in round 1 ...')
+        rescanned, _, rescan_statuses, second = run_round(context, args.clients, args.direct, ports, url,
+                                                          fresh, [], 2)
+    finally:
+        for process, _ in servers:
+            process.terminate()
+            process.wait(timeout=30)
+
+    accepted.update(rescanned)
+    statuses.update(rescan_statuses)
+    violations = check(url, tokens + fresh, accepted, issued, statuses)
+
+    requests = sum(statuses.values())
+    report = {
+        'settings': {**vars(args), 'server': server},
+        'requests': requests,
+        'seconds': round(first + second, 2),
+        'throughput_per_second': round(requests / (first + second), 1),
+        'status_codes': dict(sorted(statuses.items())),
+        'violations': violations,
+    }
+    if args.out:
+        with open(args.out, 'w') as out:
+            json.dump(report, out, indent=2)
+    if not args.dir:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    print(f"{requests:,} operations in {report['seconds']}s ({report['throughput_per_second']:,.1f}/s), "
+          f"statuses {report['status_codes']}")
+    if not violations:
+        print('✅ All invariants held')
+        return 0
+    for name, found in violations.items():
+        print(f'❌ {name}: {len(found)} violations')
+        for violation in found[:SHOW_VIOLATIONS]:
+            print(f'     {violation}')
+    return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,38 +1,29 @@
 from flask import Flask, render_template, request, jsonify, redirect, url_for
-from flask_sqlalchemy import SQLAlchemy
 import qrcode
 import io
 import base64
 import secrets
 import string
-from datetime import datetime
+import os
+import sys
+
+# Add parent directory to path for the shared models and migrations
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import db, Student
+import db_engine
+import migrations
+import repository
+from roster_cache import RosterCache
 
 app = Flask(__name__)
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///canteen.db'
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = db_engine.engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
 app.config['SECRET_KEY'] = 'your-secret-key-change-this'
 
-db = SQLAlchemy(app)
-
-# Database Models
-class Student(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    roll_number = db.Column(db.String(50), unique=True, nullable=False)
-    name = db.Column(db.String(100))
-    passes = db.relationship('LunchPass', backref='student', lazy=True)
-
-    def __repr__(self):
-        return f'<Student {self.roll_number}>'
+db.init_app(app)
 
-class LunchPass(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    student_id = db.Column(db.Integer, db.ForeignKey('student.id'), nullable=False)
-    token = db.Column(db.String(100), unique=True, nullable=False)
-    generated_at = db.Column(db.DateTime, default=datetime.utcnow)
-    used = db.Column(db.Boolean, default=False)
-    used_at = db.Column(db.DateTime)
-
-    def __repr__(self):
-        return f'<LunchPass {self.token}>'
+roster = RosterCache()
 
 # ==================== STUDENT PORTAL ====================
 @app.route('/')
@@ -51,21 +42,17 @@ def student_generate():
             return jsonify({'error': 'Roll number required'}), 400
         
         # Check if student exists
-        student = Student.query.filter_by(roll_number=roll_number).first()
+        student = roster.lookup(db.session, roll_number)
         
         if not student:
             return jsonify({'error': 'Roll number not found in system'}), 404
         
-        # Check if already has unused pass
-        existing_pass = LunchPass.query.filter_by(student_id=student.id, used=False).first()
-        if existing_pass:
-            return jsonify({'error': 'You already have an active lunch pass!'}), 400
-        
-        # Generate new token
+        # Issue a pass unless the student already has an unused one
         token = secrets.token_urlsafe(32)
-        new_pass = LunchPass(student_id=student.id, token=token)
-        db.session.add(new_pass)
+        issued = repository.issue_pass(db.session, student.id, token)
         db.session.commit()
+        if not issued:
+            return jsonify({'error': 'You already have an active lunch pass!'}), 400
         
         # Generate QR code
         qr = qrcode.QRCode(version=1, box_size=10, border=5)
@@ -128,12 +115,13 @@ def admin_students():
     if not roll_number or not name:
         return jsonify({'error': 'Roll number and name required'}), 400
     
-    if Student.query.filter_by(roll_number=roll_number).first():
+    if repository.find_student_by_roll(db.session, roll_number):
         return jsonify({'error': 'Roll number already exists'}), 400
     
     new_student = Student(roll_number=roll_number, name=name)
     db.session.add(new_student)
     db.session.commit()
+    roster.invalidate()
     
     return jsonify({'success': True, 'id': new_student.id})
 
@@ -146,6 +134,7 @@ def delete_student(student_id):
     
     db.session.delete(student)
     db.session.commit()
+    roster.invalidate()
     return jsonify({'success': True})
 
 # ==================== SCANNER/VALIDATION ====================
@@ -162,29 +151,26 @@ def validate_token():
     if not token:
         return jsonify({'error': 'Token required'}), 400
     
-    lunch_pass = LunchPass.query.filter_by(token=token).first()
-    
-    if not lunch_pass:
-        return jsonify({'error': 'Invalid token', 'valid': False}), 404
+    redeemed = repository.redeem_token(db.session, token)
+    db.session.commit()
     
-    if lunch_pass.used:
+    if not redeemed:
+        rejected = repository.rejected_pass(db.session, token)
+        if not rejected:
+            return jsonify({'error': 'Invalid token', 'valid': False}), 404
         return jsonify({
             'error': 'Token already used',
             'valid': False,
-            'student_name': lunch_pass.student.name,
-            'used_at': lunch_pass.used_at
+            'student_name': rejected.name,
+            'used_at': rejected.used_at
         }), 400
     
-    # Mark as used
-    lunch_pass.used = True
-    lunch_pass.used_at = datetime.utcnow()
-    db.session.commit()
-    
+    roll_number, name = redeemed
     return jsonify({
         'success': True,
         'valid': True,
-        'student_name': lunch_pass.student.name,
-        'roll_number': lunch_pass.student.roll_number,
+        'student_name': name,
+        'roll_number': roll_number,
         'message': 'Lunch pass valid! Entry granted.'
     })
 
@@ -197,29 +183,16 @@ def dashboard():
 @app.route('/api/stats')
 def get_stats():
     """Get dashboard statistics"""
-    total_students = Student.query.count()
-    total_passes_generated = LunchPass.query.count()
-    total_passes_used = LunchPass.query.filter_by(used=True).count()
-    passes_remaining = total_passes_generated - total_passes_used
-    
-    return jsonify({
-        'total_students': total_students,
-        'total_passes_generated': total_passes_generated,
-        'total_passes_used': total_passes_used,
-        'passes_remaining': passes_remaining,
-        'usage_percentage': round((total_passes_used / total_passes_generated * 100) if total_passes_generated > 0 else 0, 1)
-    })
+    return jsonify(repository.stats(db.session))
 
 # ==================== Initialize Database ====================
-@app.before_request
-def create_tables():
-    """Create tables if they don't exist"""
-    db.create_all()
+# Schema is migrated once at startup rather than on every request
+with app.app_context():
+    db_engine.configure(db.engine)
+    migrations.upgrade(db.engine, db.metadata)
 
 if __name__ == '__main__':
     with app.app_context():
-        db.create_all()
-        
         # Add sample students if database is empty
         if Student.query.count() == 0:
             sample_students = [
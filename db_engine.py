@@ -0,0 +1,85 @@
+"""
+Database engine settings shared by every front end
+
+The student app, the scanner app and the Streamlit app all open the same
+canteen_data.db. With SQLite's defaults (rollback journal, full fsync on
+every commit) a student's INSERT and a scanner's UPDATE lock each other
+out and gunicorn workers see "database is locked". Every SQLite
+connection is therefore set up with:
+
+- WAL journaling, so readers never block the writer and vice versa
+- a busy timeout, so a writer waits for the lock instead of failing
+- synchronous=NORMAL, which is durable across application crashes in WAL
+  mode and only syncs at checkpoints
+- a larger page cache and memory-mapped reads
+
+Pool sizes follow the backend: SQLite connections are cheap and local,
+PostgreSQL ones are pinged and recycled.
+"""
+
+import os
+
+import sqlalchemy as sa
+from sqlalchemy import event
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DATABASE_URL = f"sqlite:///{os.path.join(ROOT_DIR, 'canteen_data.db')}"
+
+BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '10000'))
+
+SQLITE_PRAGMAS = {
+    'busy_timeout': BUSY_TIMEOUT_MS,  # first, so switching to WAL can wait too
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -32000,  # KiB, i.e. 32 MB per connection
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+
+def database_url():
+    """DATABASE_URL, or the shared canteen_data.db at the repository root"""
+    url = os.getenv('DATABASE_URL', DEFAULT_DATABASE_URL)
+    if url.startswith('postgres://'):
+        url = url.replace('postgres://', 'postgresql://', 1)
+    return url
+
+
+def engine_options(url):
+    """create_engine() keyword arguments (Flask-SQLAlchemy's SQLALCHEMY_ENGINE_OPTIONS) for `url`"""
+    pool_size = int(os.getenv('DB_POOL_SIZE', '10'))
+    parsed = sa.engine.make_url(url)
+    if parsed.get_backend_name() == 'sqlite':
+        if parsed.database in (None, '', ':memory:'):
+            return {}  # one shared in-memory connection, nothing to size
+        return {
+            'pool_size': pool_size,
+            'max_overflow': pool_size * 2,
+            'connect_args': {'timeout': BUSY_TIMEOUT_MS / 1000},
+        }
+    return {
+        'pool_size': pool_size,
+        'max_overflow': pool_size * 2,
+        'pool_pre_ping': True,
+        'pool_recycle': 1800,
+    }
+
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f'PRAGMA {name} = {value}')
+    cursor.close()
+
+
+def configure(engine):
+    """Install the per-connection SQLite settings on `engine`; call before its first connection"""
+    if engine.dialect.name == 'sqlite' and not event.contains(engine, 'connect', _apply_sqlite_pragmas):
+        event.listen(engine, 'connect', _apply_sqlite_pragmas)
+    return engine
+
+
+def create_engine(url=None, **overrides):
+    """A configured engine for `url` (default: database_url())"""
+    url = url or database_url()
+    return configure(sa.create_engine(url, **{**engine_options(url), **overrides}))
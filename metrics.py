@@ -0,0 +1,207 @@
+"""
+Request metrics in the Prometheus text format
+
+Each worker process counts, per route, requests by status and a latency
+histogram, plus the number of SQL statements and the time spent in them
+per request (from SQLAlchemy cursor events). Scans are also counted by
+outcome. Recording is a few dict updates under a lock, cheap enough to
+leave on during the rush.
+
+gunicorn workers don't share memory, so each worker writes its counts to
+METRICS_DIR/<app>-<pid>.json at most once per `flush_interval` seconds
+(on its way out of a request), and /metrics sums every worker's file with
+its own live counts. Counts of a worker that exited stay in its file, so
+totals never go backwards while the service runs; clear METRICS_DIR when
+redeploying.
+"""
+
+import glob
+import json
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+
+from flask import Response, g, request
+from sqlalchemy import event
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50)
+
+HISTOGRAMS = {
+    'request_duration_seconds': ('Request latency by route', LATENCY_BUCKETS),
+    'db_queries_per_request': ('SQL statements executed per request by route', QUERY_COUNT_BUCKETS),
+    'db_seconds_per_request': ('Time spent in SQL per request by route', LATENCY_BUCKETS),
+}
+COUNTERS = {
+    'requests_total': 'Requests by route, method and status',
+    'scans_total': 'Scanned passes by outcome',
+}
+
+
+def metrics_dir():
+    return os.getenv('METRICS_DIR') or os.path.join(tempfile.gettempdir(), 'canteen-metrics')
+
+
+class Metrics:
+    def __init__(self, app_name, directory=None, flush_interval=1.0):
+        self.app_name = app_name
+        self.directory = directory or metrics_dir()
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._counters = {name: {} for name in COUNTERS}
+        self._histograms = {name: {} for name in HISTOGRAMS}
+        self._flushed_at = time.monotonic()
+        self._db = threading.local()
+
+    # ---------- recording ----------
+
+    def init_app(self, app, engine):
+        """Time every request of `app` and every statement on `engine`, and serve /metrics"""
+        os.makedirs(self.directory, exist_ok=True)
+        event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        app.add_url_rule('/metrics', 'metrics', self.metrics_view)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self._db.started = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if getattr(self._db, 'active', False):
+            self._db.queries += 1
+            self._db.seconds += time.perf_counter() - self._db.started
+
+    def _before_request(self):
+        g.metrics_started = time.perf_counter()
+        self._db.active, self._db.queries, self._db.seconds = True, 0, 0.0
+
+    def _after_request(self, response):
+        # Teardown doesn't see the response, so note its status here
+        g.metrics_status = response.status_code
+        return response
+
+    def _teardown_request(self, exc):
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+        self._db.active = False
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        status = 500 if exc is not None else getattr(g, 'metrics_status', 0)
+        with self._lock:
+            self._increment('requests_total', (route, request.method, str(status)))
+            self._observe('request_duration_seconds', route, elapsed)
+            self._observe('db_queries_per_request', route, self._db.queries)
+            self._observe('db_seconds_per_request', route, self._db.seconds)
+            due = time.monotonic() - self._flushed_at >= self.flush_interval
+            if due:
+                self._flushed_at = time.monotonic()
+        if due:
+            self.flush()
+
+    def count_scan(self, outcome):
+        with self._lock:
+            self._increment('scans_total', (outcome,))
+
+    def _increment(self, name, labels, amount=1):
+        counter = self._counters[name]
+        counter[labels] = counter.get(labels, 0) + amount
+
+    def _observe(self, name, route, value):
+        buckets = HISTOGRAMS[name][1]
+        series = self._histograms[name].get(route)
+        if series is None:
+            # One count per bucket, then +Inf, sum and count
+            series = self._histograms[name][route] = [0] * (len(buckets) + 3)
+        series[bisect_left(buckets, value)] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    # ---------- aggregation ----------
+
+    def _snapshot(self):
+        with self._lock:
+            return {
+                'counters': {name: [[list(labels), value] for labels, value in series.items()]
+                             for name, series in self._counters.items()},
+                'histograms': {name: [[route, list(values)] for route, values in series.items()]
+                               for name, series in self._histograms.items()},
+            }
+
+    def _path(self):
+        return os.path.join(self.directory, f'{self.app_name}-{os.getpid()}.json')
+
+    def flush(self):
+        """Write this worker's counts for the other workers' /metrics to read"""
+        path = self._path()
+        tmp = f'{path}.tmp'
+        with open(tmp, 'w') as out:
+            json.dump(self._snapshot(), out)
+        os.replace(tmp, path)
+
+    def _worker_snapshots(self):
+        yield self._snapshot()
+        own = self._path()
+        for path in glob.glob(os.path.join(self.directory, f'{self.app_name}-*.json')):
+            if path == own:
+                continue
+            try:
+                with open(path) as f:
+                    yield json.load(f)
+            except (OSError, ValueError):
+                continue  # removed or half-written; picked up next scrape
+
+    def collect(self):
+        """(counters, histograms, workers) summed over every worker of this app"""
+        counters = {name: {} for name in COUNTERS}
+        histograms = {name: {} for name in HISTOGRAMS}
+        workers = 0
+        for snapshot in self._worker_snapshots():
+            workers += 1
+            for name, series in snapshot['counters'].items():
+                for labels, value in series:
+                    counters[name][tuple(labels)] = counters[name].get(tuple(labels), 0) + value
+            for name, series in snapshot['histograms'].items():
+                for route, values in series:
+                    total = histograms[name].get(route)
+                    histograms[name][route] = values if total is None else [a + b for a, b in zip(total, values)]
+        return counters, histograms, workers
+
+    # ---------- exposition ----------
+
+    def render(self):
+        counters, histograms, workers = self.collect()
+        app = _label(self.app_name)
+        lines = [
+            '# HELP canteen_metrics_workers Worker processes whose counts are included',
+            '# TYPE canteen_metrics_workers gauge',
+            f'canteen_metrics_workers{{app="{app}"}} {workers}',
+        ]
+        for name, help_text in COUNTERS.items():
+            label_names = ('route', 'method', 'status') if name == 'requests_total' else ('outcome',)
+            lines += [f'# HELP canteen_{name} {help_text}', f'# TYPE canteen_{name} counter']
+            for labels, value in sorted(counters[name].items()):
+                pairs = ','.join(f'{key}="{_label(v)}"' for key, v in zip(label_names, labels))
+                lines.append(f'canteen_{name}{{app="{app}",{pairs}}} {value}')
+        for name, (help_text, buckets) in HISTOGRAMS.items():
+            lines += [f'# HELP canteen_{name} {help_text}', f'# TYPE canteen_{name} histogram']
+            for route, values in sorted(histograms[name].items()):
+                labels = f'app="{app}",route="{_label(route)}"'
+                cumulative = 0
+                for bound, count in zip(buckets + ('+Inf',), values):
+                    cumulative += count
+                    lines.append(f'canteen_{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'canteen_{name}_sum{{{labels}}} {round(values[-2], 6)}')
+                lines.append(f'canteen_{name}_count{{{labels}}} {values[-1]}')
+        return '\n'.join(lines) + '\n'
+
+    def metrics_view(self):
+        return Response(self.render(), mimetype='text/plain; version=0.0.4')
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
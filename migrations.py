@@ -0,0 +1,313 @@
+"""
+Versioned schema migrations
+
+Every migration runs once, in order, and is recorded in the schema_version
+table. The apps call upgrade() when they start, so no schema work is left
+on the request path; it can also be run by hand against DATABASE_URL (or
+the shared canteen_data.db):
+
+    python migrations.py            # upgrade to the latest version
+    python migrations.py status
+
+Several workers may start at once, so each migration must be idempotent:
+a worker that loses the race re-runs it harmlessly and skips recording it.
+"""
+
+import sys
+from datetime import datetime
+
+import sqlalchemy as sa
+from sqlalchemy.exc import DatabaseError, IntegrityError
+
+MIGRATIONS = []
+
+schema_version = sa.Table(
+    'schema_version', sa.MetaData(),
+    sa.Column('version', sa.Integer, primary_key=True),
+    sa.Column('description', sa.String(200), nullable=False),
+    sa.Column('applied_at', sa.DateTime, nullable=False),
+)
+
+
+def migration(version, description):
+    def register(fn):
+        MIGRATIONS.append((version, description, fn))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return fn
+    return register
+
+
+def _lunch_pass_columns():
+    """Detached lunch_pass table carrying just the columns our indexes need"""
+    return sa.Table(
+        'lunch_pass', sa.MetaData(),
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('student_id', sa.Integer),
+        sa.Column('used', sa.Boolean),
+        sa.Column('generated_at', sa.DateTime),
+    )
+
+
+@migration(1, 'Create student and lunch_pass tables')
+def _create_tables(conn, metadata):
+    metadata.create_all(conn, tables=[metadata.tables['student'], metadata.tables['lunch_pass']])
+
+
+@migration(2, 'Index lunch_pass for active-pass lookups and recency sorts')
+def _pass_indexes(conn, metadata):
+    lunch_pass = _lunch_pass_columns()
+    unused = lunch_pass.c.used == sa.false()
+    for index in [
+        sa.Index('ix_lunch_pass_student_active', lunch_pass.c.student_id,
+                 sqlite_where=unused, postgresql_where=unused),
+        sa.Index('ix_lunch_pass_student_used', lunch_pass.c.student_id, lunch_pass.c.used),
+        sa.Index('ix_lunch_pass_generated_at', lunch_pass.c.generated_at),
+    ]:
+        index.create(conn, checkfirst=True)
+
+
+@migration(3, 'Allow at most one unused pass per student')
+def _unique_active_pass(conn, metadata):
+    lunch_pass = _lunch_pass_columns()
+    unused = lunch_pass.c.used == sa.false()
+    # Keep only the newest unused pass of any student who raced into several
+    newest = sa.select(sa.func.max(lunch_pass.c.id)).where(unused).group_by(lunch_pass.c.student_id)
+    conn.execute(lunch_pass.delete().where(unused, lunch_pass.c.id.not_in(newest)))
+    conn.exec_driver_sql('DROP INDEX IF EXISTS ix_lunch_pass_student_active')
+    sa.Index('uq_lunch_pass_student_active', lunch_pass.c.student_id, unique=True,
+             sqlite_where=unused, postgresql_where=unused).create(conn, checkfirst=True)
+
+
+STATS_COUNTERS = {
+    'students': 'SELECT COUNT(*) FROM student',
+    'passes_generated': 'SELECT COUNT(*) FROM lunch_pass',
+    'passes_used': 'SELECT COUNT(*) FROM lunch_pass WHERE used',
+}
+
+SQLITE_COUNTER_TRIGGERS = [
+    """CREATE TRIGGER IF NOT EXISTS trg_student_insert_stats AFTER INSERT ON student BEGIN
+        UPDATE stats_counter SET value = value + 1 WHERE name = 'students';
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS trg_student_delete_stats AFTER DELETE ON student BEGIN
+        UPDATE stats_counter SET value = value - 1 WHERE name = 'students';
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS trg_lunch_pass_insert_stats AFTER INSERT ON lunch_pass BEGIN
+        UPDATE stats_counter SET value = value + 1 WHERE name = 'passes_generated';
+        UPDATE stats_counter SET value = value + 1 WHERE name = 'passes_used' AND NEW.used;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS trg_lunch_pass_delete_stats AFTER DELETE ON lunch_pass BEGIN
+        UPDATE stats_counter SET value = value - 1 WHERE name = 'passes_generated';
+        UPDATE stats_counter SET value = value - 1 WHERE name = 'passes_used' AND OLD.used;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS trg_lunch_pass_used_stats AFTER UPDATE OF used ON lunch_pass
+    WHEN NEW.used IS NOT OLD.used BEGIN
+        UPDATE stats_counter SET value = value + (CASE WHEN NEW.used THEN 1 ELSE -1 END)
+        WHERE name = 'passes_used';
+    END""",
+]
+
+POSTGRES_COUNTER_TRIGGERS = [
+    """CREATE OR REPLACE FUNCTION stats_counter_student() RETURNS trigger AS $$
+    BEGIN
+        UPDATE stats_counter SET value = value + (CASE WHEN TG_OP = 'INSERT' THEN 1 ELSE -1 END)
+        WHERE name = 'students';
+        RETURN NULL;
+    END $$ LANGUAGE plpgsql""",
+    """CREATE OR REPLACE FUNCTION stats_counter_lunch_pass() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            UPDATE stats_counter SET value = value + 1 WHERE name = 'passes_generated';
+            UPDATE stats_counter SET value = value + 1 WHERE name = 'passes_used' AND NEW.used;
+        ELSIF TG_OP = 'DELETE' THEN
+            UPDATE stats_counter SET value = value - 1 WHERE name = 'passes_generated';
+            UPDATE stats_counter SET value = value - 1 WHERE name = 'passes_used' AND OLD.used;
+        ELSIF NEW.used IS DISTINCT FROM OLD.used THEN
+            UPDATE stats_counter SET value = value + (CASE WHEN NEW.used THEN 1 ELSE -1 END)
+            WHERE name = 'passes_used';
+        END IF;
+        RETURN NULL;
+    END $$ LANGUAGE plpgsql""",
+    "DROP TRIGGER IF EXISTS trg_student_stats ON student",
+    """CREATE TRIGGER trg_student_stats AFTER INSERT OR DELETE ON student
+    FOR EACH ROW EXECUTE FUNCTION stats_counter_student()""",
+    "DROP TRIGGER IF EXISTS trg_lunch_pass_stats ON lunch_pass",
+    """CREATE TRIGGER trg_lunch_pass_stats AFTER INSERT OR DELETE OR UPDATE OF used ON lunch_pass
+    FOR EACH ROW EXECUTE FUNCTION stats_counter_lunch_pass()""",
+]
+
+
+@migration(4, 'Keep dashboard totals in a trigger-maintained stats_counter table')
+def _stats_counters(conn, metadata):
+    stats_counter = sa.Table(
+        'stats_counter', sa.MetaData(),
+        sa.Column('name', sa.String(50), primary_key=True),
+        sa.Column('value', sa.Integer, nullable=False, default=0),
+    )
+    stats_counter.create(conn, checkfirst=True)
+    triggers = POSTGRES_COUNTER_TRIGGERS if conn.dialect.name == 'postgresql' else SQLITE_COUNTER_TRIGGERS
+    for ddl in triggers:
+        conn.exec_driver_sql(ddl)
+    conn.execute(stats_counter.delete().where(stats_counter.c.name.in_(STATS_COUNTERS)))
+    for name, count_sql in STATS_COUNTERS.items():
+        conn.exec_driver_sql(f"INSERT INTO stats_counter (name, value) SELECT '{name}', ({count_sql})")
+
+
+@migration(5, 'Track background roster imports in import_job')
+def _import_jobs(conn, metadata):
+    sa.Table(
+        'import_job', sa.MetaData(),
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('filename', sa.String(255), nullable=False),
+        sa.Column('update_names', sa.Boolean, nullable=False),
+        sa.Column('status', sa.String(20), nullable=False),
+        sa.Column('rows', sa.Integer, nullable=False),
+        sa.Column('added', sa.Integer, nullable=False),
+        sa.Column('updated', sa.Integer, nullable=False),
+        sa.Column('skipped', sa.Integer, nullable=False),
+        sa.Column('error', sa.Text),
+        sa.Column('created_at', sa.DateTime, nullable=False),
+        sa.Column('started_at', sa.DateTime),
+        sa.Column('finished_at', sa.DateTime),
+    ).create(conn, checkfirst=True)
+
+
+ROSTER_VERSION = 'roster_version'
+
+SQLITE_ROSTER_TRIGGERS = [
+    f"""CREATE TRIGGER IF NOT EXISTS trg_student_{event.lower()}_roster AFTER {event} ON student BEGIN
+        UPDATE stats_counter SET value = value + 1 WHERE name = '{ROSTER_VERSION}';
+    END"""
+    for event in ('INSERT', 'UPDATE', 'DELETE')
+]
+
+POSTGRES_ROSTER_TRIGGERS = [
+    f"""CREATE OR REPLACE FUNCTION stats_counter_roster() RETURNS trigger AS $$
+    BEGIN
+        UPDATE stats_counter SET value = value + 1 WHERE name = '{ROSTER_VERSION}';
+        RETURN NULL;
+    END $$ LANGUAGE plpgsql""",
+    "DROP TRIGGER IF EXISTS trg_student_roster ON student",
+    # Once per statement, so a bulk roster import bumps the version once per chunk
+    """CREATE TRIGGER trg_student_roster AFTER INSERT OR UPDATE OR DELETE ON student
+    FOR EACH STATEMENT EXECUTE FUNCTION stats_counter_roster()""",
+]
+
+
+@migration(6, 'Bump a roster_version counter on every change to student')
+def _roster_version(conn, metadata):
+    triggers = POSTGRES_ROSTER_TRIGGERS if conn.dialect.name == 'postgresql' else SQLITE_ROSTER_TRIGGERS
+    for ddl in triggers:
+        conn.exec_driver_sql(ddl)
+    conn.exec_driver_sql(
+        f"INSERT INTO stats_counter (name, value) SELECT '{ROSTER_VERSION}', 0 "
+        f"WHERE NOT EXISTS (SELECT 1 FROM stats_counter WHERE name = '{ROSTER_VERSION}')"
+    )
+
+
+# What the counters track once passes can be archived (migration 7)
+TOTAL_STATS_COUNTERS = {
+    'students': STATS_COUNTERS['students'],
+    'passes_generated': 'SELECT (SELECT COUNT(*) FROM lunch_pass) + (SELECT COUNT(*) FROM lunch_pass_archive)',
+    'passes_used': 'SELECT (SELECT COUNT(*) FROM lunch_pass WHERE used) '
+                   '+ (SELECT COUNT(*) FROM lunch_pass_archive WHERE used)',
+}
+
+# Archiving deletes from lunch_pass (which counts down) and inserts here
+# (which counts back up) in one transaction, so the totals never move
+SQLITE_ARCHIVE_TRIGGERS = [
+    """CREATE TRIGGER IF NOT EXISTS trg_lunch_pass_archive_insert_stats AFTER INSERT ON lunch_pass_archive BEGIN
+        UPDATE stats_counter SET value = value + 1 WHERE name = 'passes_generated';
+        UPDATE stats_counter SET value = value + 1 WHERE name = 'passes_used' AND NEW.used;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS trg_lunch_pass_archive_delete_stats AFTER DELETE ON lunch_pass_archive BEGIN
+        UPDATE stats_counter SET value = value - 1 WHERE name = 'passes_generated';
+        UPDATE stats_counter SET value = value - 1 WHERE name = 'passes_used' AND OLD.used;
+    END""",
+]
+
+POSTGRES_ARCHIVE_TRIGGERS = [
+    "DROP TRIGGER IF EXISTS trg_lunch_pass_archive_stats ON lunch_pass_archive",
+    # Same bookkeeping as lunch_pass; archived rows are never updated
+    """CREATE TRIGGER trg_lunch_pass_archive_stats AFTER INSERT OR DELETE ON lunch_pass_archive
+    FOR EACH ROW EXECUTE FUNCTION stats_counter_lunch_pass()""",
+]
+
+
+@migration(7, 'Archive redeemed and expired passes of past days in lunch_pass_archive')
+def _pass_archive(conn, metadata):
+    archive = sa.Table(
+        'lunch_pass_archive', sa.MetaData(),
+        sa.Column('id', sa.Integer, primary_key=True, autoincrement=False),
+        sa.Column('student_id', sa.Integer, nullable=False),
+        sa.Column('token', sa.String(100), nullable=False, unique=True),
+        sa.Column('generated_at', sa.DateTime),
+        sa.Column('used', sa.Boolean),
+        sa.Column('used_at', sa.DateTime),
+        sa.Column('archived_at', sa.DateTime, nullable=False),
+        sa.Index('ix_lunch_pass_archive_student_used', 'student_id', 'used'),
+        sa.Index('ix_lunch_pass_archive_generated_at', 'generated_at'),
+    )
+    archive.create(conn, checkfirst=True)
+    triggers = POSTGRES_ARCHIVE_TRIGGERS if conn.dialect.name == 'postgresql' else SQLITE_ARCHIVE_TRIGGERS
+    for ddl in triggers:
+        conn.exec_driver_sql(ddl)
+
+
+def current_version(conn):
+    schema_version.create(conn, checkfirst=True)
+    return conn.execute(sa.select(sa.func.max(schema_version.c.version))).scalar() or 0
+
+
+def upgrade(engine, metadata, target=None):
+    """Apply pending migrations up to `target` (default: all), returning their versions"""
+    applied = []
+    try:
+        with engine.begin() as conn:
+            version = current_version(conn)
+    except DatabaseError:
+        # Lost the race to create schema_version; it exists now
+        with engine.begin() as conn:
+            version = current_version(conn)
+    for number, description, fn in MIGRATIONS:
+        if number <= version or (target is not None and number > target):
+            continue
+        try:
+            with engine.begin() as conn:
+                if current_version(conn) >= number:
+                    continue
+                fn(conn, metadata)
+                conn.execute(schema_version.insert().values(
+                    version=number, description=description, applied_at=datetime.utcnow()
+                ))
+        except IntegrityError:
+            # Another worker recorded this version first
+            continue
+        applied.append(number)
+    return applied
+
+
+def status(engine):
+    """(version, description, applied_at or None) for every known migration"""
+    with engine.begin() as conn:
+        current_version(conn)
+        done = dict(conn.execute(sa.select(schema_version.c.version, schema_version.c.applied_at)).all())
+    return [(number, description, done.get(number)) for number, description, _ in MIGRATIONS]
+
+
+if __name__ == '__main__':
+    import db_engine
+    from models import db
+
+    engine = db_engine.create_engine()
+
+    command = sys.argv[1] if len(sys.argv) > 1 else 'upgrade'
+    if command == 'status':
+        for number, description, applied_at in status(engine):
+            state = f"applied {applied_at:%Y-%m-%d %H:%M}" if applied_at else "pending"
+            print(f"{number:>4}  {state:<24}  {description}")
+    elif command == 'upgrade':
+        applied = upgrade(engine, db.metadata)
+        print(f"✅ Applied migrations: {applied}" if applied else "✅ Schema is up to date")
+    else:
+        print("Usage: python migrations.py [upgrade|status]")
+        sys.exit(1)
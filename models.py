@@ -1,4 +1,6 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import func
+from sqlalchemy.dialects import postgresql, sqlite
 from datetime import datetime
 
 db = SQLAlchemy()
@@ -22,3 +24,78 @@ class LunchPass(db.Model):
 
     def __repr__(self):
         return f'<LunchPass {self.token}>'
+
+class LunchPassArchive(db.Model):
+    """Redeemed and expired passes of past meal days, moved out of lunch_pass by the daily rollover"""
+    __tablename__ = 'lunch_pass_archive'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)  # the id it had in lunch_pass
+    student_id = db.Column(db.Integer, nullable=False)  # history outlives a deleted student
+    token = db.Column(db.String(100), unique=True, nullable=False)
+    generated_at = db.Column(db.DateTime)
+    used = db.Column(db.Boolean)
+    used_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return f'<LunchPassArchive {self.token}>'
+
+class StatsCounter(db.Model):
+    """Running dashboard totals, kept current by database triggers (see migrations.py)"""
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<StatsCounter {self.name}={self.value}>'
+
+class ImportJob(db.Model):
+    """A roster upload imported in the background, with its progress so far"""
+    id = db.Column(db.Integer, primary_key=True)
+    filename = db.Column(db.String(255), nullable=False)
+    update_names = db.Column(db.Boolean, nullable=False, default=False)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, done, failed
+    rows = db.Column(db.Integer, nullable=False, default=0)
+    added = db.Column(db.Integer, nullable=False, default=0)
+    updated = db.Column(db.Integer, nullable=False, default=0)
+    skipped = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f'<ImportJob {self.id} {self.status}>'
+
+def read_counters(session):
+    """All running totals in one primary-key read"""
+    return dict(session.query(StatsCounter.name, StatsCounter.value).all())
+
+def _counted_totals():
+    """COUNT(*) expressions the counters must always agree with; passes count live and archived alike"""
+    return {
+        'students': db.select(func.count(Student.id)).scalar_subquery(),
+        'passes_generated': (db.select(func.count(LunchPass.id)).scalar_subquery()
+                             + db.select(func.count(LunchPassArchive.id)).scalar_subquery()),
+        'passes_used': (db.select(func.count(LunchPass.id)).where(LunchPass.used).scalar_subquery()
+                        + db.select(func.count(LunchPassArchive.id)).where(LunchPassArchive.used).scalar_subquery()),
+    }
+
+def reconcile_counters(session):
+    """Recompute every counter from scratch, returning {name: (stored, counted)} for those that drifted
+
+    Each counter is rewritten by a single UPDATE ... SET value = (SELECT COUNT(*)),
+    so writers running concurrently are never lost.
+    """
+    stored = read_counters(session)
+    for name, counted in _counted_totals().items():
+        if name not in stored:
+            session.add(StatsCounter(name=name, value=0))
+            session.flush()
+        session.execute(db.update(StatsCounter).where(StatsCounter.name == name).values(value=counted))
+    recounted = read_counters(session)
+    session.commit()
+    return {name: (stored.get(name), value) for name, value in recounted.items() if stored.get(name) != value}
+
+def insert_or_ignore(model, dialect_name):
+    """INSERT ... ON CONFLICT DO NOTHING, so a unique index decides instead of a prior SELECT"""
+    insert = postgresql.insert if dialect_name == 'postgresql' else sqlite.insert
+    return insert(model).on_conflict_do_nothing()
@@ -0,0 +1,219 @@
+"""
+Opt-in request profiling and a slow-query log
+
+Both are off unless configured, and write plain-text reports to
+PROFILE_DIR (shared by every app on a host), keeping the newest
+PROFILE_KEEP reports; the admin portal lists them at /admin/profiles.
+
+- Request profiles: a request runs under cProfile when it carries an
+  X-Profile-Token header equal to PROFILE_TOKEN, or at random for a
+  PROFILE_SAMPLE_RATE fraction of requests. The report holds the top
+  functions by cumulative time; the raw .prof file next to it opens in
+  pstats or snakeviz.
+- Slow queries: any statement on a watched engine slower than
+  SLOW_QUERY_MS is logged with the shape of its parameters (names and
+  types, never values) and its query plan (EXPLAIN QUERY PLAN on SQLite,
+  EXPLAIN on PostgreSQL).
+
+    PROFILE_TOKEN=s3cret SLOW_QUERY_MS=50 gunicorn app:app
+    curl -H 'X-Profile-Token: s3cret' -X POST .../api/validate-token -d ...
+"""
+
+import cProfile
+import hmac
+import io
+import os
+import pstats
+import random
+import re
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+PROFILE_HEADER = 'X-Profile-Token'
+REPORT_SUFFIX = '.txt'
+TOP_FUNCTIONS = 40
+EXPLAINABLE = ('select', 'update', 'delete', 'insert', 'with')
+EXPLAIN_PREFIX = {'sqlite': 'EXPLAIN QUERY PLAN ', 'postgresql': 'EXPLAIN '}
+
+
+def profile_dir():
+    return os.getenv('PROFILE_DIR') or os.path.join(tempfile.gettempdir(), 'canteen-profiles')
+
+
+def _slug(text):
+    return re.sub(r'[^A-Za-z0-9]+', '-', text).strip('-')[:60] or 'root'
+
+
+def parameter_shape(parameters, executemany):
+    """Parameter names and types, never their values"""
+    if executemany:
+        rows = list(parameters)
+        first = parameter_shape(rows[0], False) if rows else '-'
+        return f'{len(rows)} sets of {first}'
+    if isinstance(parameters, dict):
+        return '{' + ', '.join(f'{name}: {type(value).__name__}' for name, value in parameters.items()) + '}'
+    if isinstance(parameters, (list, tuple)):
+        return '(' + ', '.join(type(value).__name__ for value in parameters) + ')'
+    return type(parameters).__name__
+
+
+class Profiler:
+    def __init__(self, app_name, directory=None, slow_query_ms=None, sample_rate=None, token=None, keep=None):
+        self.app_name = app_name
+        self.directory = directory or profile_dir()
+        self.slow_query_ms = float(os.getenv('SLOW_QUERY_MS', '0') if slow_query_ms is None else slow_query_ms)
+        self.sample_rate = float(os.getenv('PROFILE_SAMPLE_RATE', '0') if sample_rate is None else sample_rate)
+        self.token = os.getenv('PROFILE_TOKEN', '') if token is None else token
+        self.keep = int(os.getenv('PROFILE_KEEP', '200') if keep is None else keep)
+        self._write_lock = threading.Lock()
+
+    # ---------- slow queries ----------
+
+    def watch_engine(self, engine):
+        """Log statements on `engine` slower than slow_query_ms (no-op when that is 0)"""
+        if self.slow_query_ms <= 0:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+        event.listen(engine, 'handle_error', self._handle_error)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('profiling_started', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed_ms = (time.perf_counter() - conn.info['profiling_started'].pop()) * 1000
+        if elapsed_ms < self.slow_query_ms:
+            return
+        plan = self._query_plan(conn, cursor, statement, parameters, executemany)
+        where = f'{request.method} {request.path}' if has_request_context() else '-'
+        self._write('slow-query', _slug(statement.split(None, 1)[0] if statement.strip() else 'sql'), [
+            f'Slow query: {elapsed_ms:.1f} ms (threshold {self.slow_query_ms:g} ms)',
+            f'App: {self.app_name}  PID: {os.getpid()}  Request: {where}',
+            f'Parameters: {parameter_shape(parameters, executemany)}',
+            '',
+            statement.strip(),
+            '',
+            'Query plan:',
+            plan,
+        ])
+
+    def _handle_error(self, context):
+        # A failed statement never reaches after_cursor_execute
+        started = context.connection.info.get('profiling_started') if context.connection is not None else None
+        if started:
+            started.pop()
+
+    def _query_plan(self, conn, cursor, statement, parameters, executemany):
+        prefix = EXPLAIN_PREFIX.get(conn.dialect.name)
+        if not prefix or not statement.lstrip().lower().startswith(EXPLAINABLE):
+            return '  (not available for this statement)'
+        if executemany:
+            parameters = next(iter(parameters), ())
+        try:
+            # A raw cursor on the same connection, so the plan is never itself timed or logged
+            explain = cursor.connection.cursor()
+            try:
+                explain.execute(prefix + statement, parameters)
+                return '\n'.join('  ' + ' | '.join(str(column) for column in row) for row in explain.fetchall())
+            finally:
+                explain.close()
+        except Exception as e:
+            return f'  (EXPLAIN failed: {e})'
+
+    # ---------- request profiles ----------
+
+    def init_app(self, app, engine):
+        """Watch `engine` for slow queries and profile requests as configured"""
+        self.watch_engine(engine)
+        if self.token or self.sample_rate > 0:
+            os.makedirs(self.directory, exist_ok=True)
+            app.before_request(self._before_request)
+            app.teardown_request(self._teardown_request)
+
+    def _wants_profile(self):
+        supplied = request.headers.get(PROFILE_HEADER)
+        if supplied and self.token and hmac.compare_digest(supplied.encode(), self.token.encode()):
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def _before_request(self):
+        if self._wants_profile():
+            g.profile = cProfile.Profile()
+            g.profile_started = time.perf_counter()
+            g.profile.enable()
+
+    def _teardown_request(self, exc):
+        profile = g.pop('profile', None)
+        if profile is None:
+            return
+        profile.disable()
+        elapsed_ms = (time.perf_counter() - g.pop('profile_started')) * 1000
+        out = io.StringIO()
+        stats = pstats.Stats(profile, stream=out)
+        stats.sort_stats('cumulative').print_stats(TOP_FUNCTIONS)
+        route = request.url_rule.rule if request.url_rule else request.path
+        path = self._write('profile', _slug(route), [
+            f'Request profile: {request.method} {request.path} in {elapsed_ms:.1f} ms'
+            + (f' (failed: {exc!r})' if exc is not None else ''),
+            f'App: {self.app_name}  PID: {os.getpid()}',
+            '',
+            out.getvalue().strip(),
+        ])
+        stats.dump_stats(path[:-len(REPORT_SUFFIX)] + '.prof')
+
+    # ---------- reports ----------
+
+    def _write(self, kind, subject, lines):
+        now = datetime.now()
+        name = f"{now:%Y%m%d-%H%M%S-%f}-{self.app_name}-{kind}-{subject}{REPORT_SUFFIX}"
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as out:
+            out.write(f'When: {now:%Y-%m-%d %H:%M:%S}\n' + '\n'.join(lines) + '\n')
+        with self._write_lock:
+            self._rotate()
+        return path
+
+    def _rotate(self):
+        reports = sorted(name for name in os.listdir(self.directory) if name.endswith(REPORT_SUFFIX))
+        for name in reports[:max(len(reports) - self.keep, 0)]:
+            for stale in (name, name[:-len(REPORT_SUFFIX)] + '.prof'):
+                try:
+                    os.remove(os.path.join(self.directory, stale))
+                except FileNotFoundError:
+                    pass
+
+
+def list_reports(directory=None):
+    """Newest first: {'name', 'app', 'kind', 'created', 'size', 'has_prof'} for every report in `directory`"""
+    directory = directory or profile_dir()
+    if not os.path.isdir(directory):
+        return []
+    reports = []
+    for name in sorted(os.listdir(directory), reverse=True):
+        if not name.endswith(REPORT_SUFFIX):
+            continue
+        match = re.match(r'\d{8}-\d{6}-\d{6}-(.+?)-(profile|slow-query)-', name)
+        reports.append({
+            'name': name,
+            'app': match.group(1) if match else '?',
+            'kind': match.group(2) if match else '?',
+            'created': datetime.strptime(name[:15], '%Y%m%d-%H%M%S').isoformat() if match else None,
+            'size': os.path.getsize(os.path.join(directory, name)),
+            'has_prof': os.path.exists(os.path.join(directory, name[:-len(REPORT_SUFFIX)] + '.prof')),
+        })
+    return reports
+
+
+def report_path(name, directory=None):
+    """Path of the report or .prof file called `name`, or None if there is no such file"""
+    directory = directory or profile_dir()
+    if os.path.basename(name) != name or not name.endswith((REPORT_SUFFIX, '.prof')):
+        return None
+    path = os.path.join(directory, name)
+    return path if os.path.isfile(path) else None
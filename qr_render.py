@@ -0,0 +1,147 @@
+"""
+QR code rendering for lunch passes
+
+Codes are drawn straight from the QR module matrix: PNG as a 1-bit image
+scaled up with nearest-neighbour resampling, SVG as a single path of
+horizontal runs. Both are far cheaper than qrcode's image factories, and a
+fixed mask pattern skips qrcode's trial layouts. A pass token never
+changes, so rendered codes are kept in an LRU cache keyed by token and
+format (QR_CACHE_SIZE entries, default 4096).
+
+Codes can also be rendered ahead of time into QR_CACHE_DIR (see
+prerender_all), a directory shared by the apps on one host; render() reads
+a pre-rendered file before drawing the code itself.
+"""
+
+import hashlib
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from multiprocessing import get_context
+
+import qrcode
+from PIL import Image
+from qrcode.constants import ERROR_CORRECT_L, ERROR_CORRECT_M
+
+FORMATS = {
+    'png': 'image/png',
+    'svg': 'image/svg+xml',
+}
+
+BORDER = 4  # quiet zone, in modules, required by the QR spec
+TARGET_PIXELS = 400  # approximate PNG width, borders included
+
+# Byte-mode capacity of version 4 at error correction M; tokens that fit
+# (random and signed passes both do) get M, longer ones drop to L so the
+# code stays small enough for phone screens and cheap webcams
+MEDIUM_CORRECTION_MAX_LENGTH = 62
+
+# qrcode otherwise lays the code out under all eight mask patterns to score
+# them, which is ~90% of the render time. Any mask is valid per the spec;
+# scanners read a fixed one just as well.
+MASK_PATTERN = 0
+
+
+def qr_matrix(token):
+    """Rows of booleans (True = dark module), quiet zone included"""
+    correction = ERROR_CORRECT_M if len(token) <= MEDIUM_CORRECTION_MAX_LENGTH else ERROR_CORRECT_L
+    qr = qrcode.QRCode(version=None, error_correction=correction, border=BORDER, mask_pattern=MASK_PATTERN)
+    qr.add_data(token.encode('ascii'), optimize=0)
+    qr.make(fit=True)
+    return qr.get_matrix()
+
+
+def qr_image(matrix, box_size):
+    """1-bit PIL image of a module matrix, `box_size` pixels per module"""
+    size = len(matrix)
+    pixels = bytes(0 if dark else 255 for row in matrix for dark in row)
+    # Drop to 1-bit before scaling up, so only the small image is converted
+    image = Image.frombytes('L', (size, size), pixels).convert('1')
+    return image.resize((size * box_size, size * box_size), Image.Resampling.NEAREST)
+
+
+def _png(matrix):
+    out = io.BytesIO()
+    qr_image(matrix, max(TARGET_PIXELS // len(matrix), 2)).save(out, 'PNG')
+    return out.getvalue()
+
+
+def _svg(matrix):
+    size = len(matrix)
+    path = []
+    for y, row in enumerate(matrix):
+        x = 0
+        while x < size:
+            if not row[x]:
+                x += 1
+                continue
+            start = x
+            while x < size and row[x]:
+                x += 1
+            path.append(f'M{start} {y}h{x - start}v1h-{x - start}z')
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {size} {size}" '
+        f'shape-rendering="crispEdges"><rect width="{size}" height="{size}" fill="#fff"/>'
+        f'<path fill="#000" d="{"".join(path)}"/></svg>'
+    ).encode('ascii')
+
+
+RENDERERS = {
+    'png': _png,
+    'svg': _svg,
+}
+
+
+QR_CACHE_DIR = os.getenv('QR_CACHE_DIR')
+
+
+def cache_path(directory, token, fmt):
+    # Hashed, so directory listings don't give away live tokens
+    return os.path.join(directory, f"{hashlib.sha256(token.encode()).hexdigest()}.{fmt}")
+
+
+@lru_cache(maxsize=int(os.getenv('QR_CACHE_SIZE', '4096')))
+def render(token, fmt='png'):
+    """Encoded QR image bytes for `token` in `fmt` ('png' or 'svg')"""
+    if fmt not in RENDERERS:
+        raise ValueError(f'Unsupported QR format: {fmt}')
+    if QR_CACHE_DIR:
+        try:
+            with open(cache_path(QR_CACHE_DIR, token, fmt), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            pass
+    return RENDERERS[fmt](qr_matrix(token))
+
+
+def _prerender(args):
+    directory, tokens, fmt = args
+    for token in tokens:
+        path = cache_path(directory, token, fmt)
+        if os.path.exists(path):
+            continue
+        # Write then rename, so a reader never sees half a file
+        partial = f'{path}.{os.getpid()}.tmp'
+        with open(partial, 'wb') as f:
+            f.write(RENDERERS[fmt](qr_matrix(token)))
+        os.replace(partial, path)
+    return len(tokens)
+
+
+def prerender_all(tokens, directory, fmt='png', workers=None, chunk_size=250):
+    """Render every token into `directory` across a process pool; returns how many"""
+    if fmt not in RENDERERS:
+        raise ValueError(f'Unsupported QR format: {fmt}')
+    os.makedirs(directory, exist_ok=True)
+    tokens = list(tokens)
+    chunks = [(directory, tokens[i:i + chunk_size], fmt) for i in range(0, len(tokens), chunk_size)]
+    if len(chunks) <= 1:
+        return sum(map(_prerender, chunks))
+    # Spawned rather than forked: callers may be threaded web workers
+    with ProcessPoolExecutor(max_workers=workers, mp_context=get_context('spawn')) as pool:
+        return sum(pool.map(_prerender, chunks))
+
+
+def cache_info():
+    return render.cache_info()._asdict()
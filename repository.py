@@ -0,0 +1,202 @@
+"""
+Hot-path data access shared by every front end
+
+Each statement is built once, here, with bound parameters, so a request
+only binds values: SQLAlchemy's compiled cache on the engine keys on the
+statement's structure and reuses the SQL it rendered the first time,
+instead of a query being assembled and compiled per call.
+
+Functions take a Session or a Connection and never commit; the caller owns
+the transaction, so several calls can share one (as batch scans do).
+"""
+
+from datetime import datetime
+from functools import lru_cache
+
+from sqlalchemy import and_, bindparam, delete, false, func, select, union_all, update
+
+import signed_pass
+from models import LunchPass, LunchPassArchive, StatsCounter, Student, insert_or_ignore
+
+_pass_holder = Student.id == LunchPass.student_id
+
+FIND_STUDENT_BY_ROLL = (
+    select(Student.id, Student.roll_number, Student.name)
+    .where(Student.roll_number == bindparam('roll'))
+)
+
+ROSTER = select(Student.roll_number, Student.id, Student.name)
+
+# Bumped by triggers on every change to student (migration 6)
+ROSTER_VERSION = select(StatsCounter.value).where(StatsCounter.name == 'roster_version')
+
+ACTIVE_PASS = (
+    select(LunchPass.id, LunchPass.token)
+    .where(LunchPass.student_id == bindparam('holder_id'), LunchPass.used == false())
+)
+
+# Primary-key probe that a pass has not been redeemed since it was handed out
+PASS_STILL_ACTIVE = select(LunchPass.id).where(LunchPass.id == bindparam('pass_id'), LunchPass.used == false())
+
+PASS_TOKEN = select(LunchPass.token).where(LunchPass.id == bindparam('pass_id'))
+
+# A signed pass that expired unused still holds its student's slot in the
+# "one unused pass" index; it is moved to the archive, keeping its id, in
+# the transaction that issues the replacement
+DELETE_UNUSED_PASS = delete(LunchPass).where(LunchPass.id == bindparam('pass_id'), LunchPass.used == false())
+
+# SQLite hands out max(id) + 1, which right after retiring the newest pass
+# is the id that pass keeps in the archive, so replacements take the next
+# id past both tables instead
+NEXT_PASS_ID = select(func.max(
+    func.coalesce(select(func.max(LunchPass.id)).scalar_subquery(), 0),
+    func.coalesce(select(func.max(LunchPassArchive.id)).scalar_subquery(), 0),
+) + 1)
+
+# Redemption is a single conditional UPDATE: only a row that is still unused
+# flips, and the holder's roll number and name come back in the same round
+# trip, so two workers scanning the same token can never both succeed.
+REDEEM_PASS = (
+    update(LunchPass)
+    .where(LunchPass.token == bindparam('scanned_token'), LunchPass.used == false())
+    .values(used=True, used_at=bindparam('now'))
+    .returning(
+        select(Student.roll_number).where(_pass_holder).scalar_subquery().label('roll_number'),
+        select(Student.name).where(_pass_holder).scalar_subquery().label('name'),
+    )
+)
+
+# Only consulted when REDEEM_PASS matched nothing, to tell "unknown" from
+# "used"; passes of past days may have been rolled over into the archive
+REJECTED_PASS = union_all(
+    select(LunchPass.used_at, Student.name, Student.roll_number)
+    .outerjoin(Student, _pass_holder)
+    .where(LunchPass.token == bindparam('scanned_token')),
+    select(LunchPassArchive.used_at, Student.name, Student.roll_number)
+    .outerjoin(Student, Student.id == LunchPassArchive.student_id)
+    .where(LunchPassArchive.token == bindparam('scanned_token')),
+)
+
+# Authoritative "was this token ever issued" probe on the token unique indexes,
+# for tokens the scanner's in-memory index has not seen yet
+ISSUED_PASS_ID = union_all(
+    select(LunchPass.id).where(LunchPass.token == bindparam('scanned_token')),
+    select(LunchPassArchive.id).where(LunchPassArchive.token == bindparam('scanned_token')),
+)
+
+COUNTERS = select(StatsCounter.name, StatsCounter.value)
+
+
+@lru_cache(maxsize=None)
+def issue_pass_statement(dialect_name, explicit_id=False):
+    """One INSERT guarded by the "one unused pass per student" unique index;
+    it returns no row when the student already holds an active pass"""
+    values = dict(student_id=bindparam('holder_id'), token=bindparam('new_token'),
+                  generated_at=bindparam('now'), used=False)
+    if explicit_id:
+        values['id'] = bindparam('new_id')
+    return insert_or_ignore(LunchPass, dialect_name).values(**values).returning(LunchPass.id)
+
+
+@lru_cache(maxsize=None)
+def archive_pass_statement(dialect_name):
+    """Copy one unused pass into the archive; a no-op if a concurrent request already did"""
+    columns = [LunchPass.id, LunchPass.student_id, LunchPass.token, LunchPass.generated_at,
+               LunchPass.used, LunchPass.used_at]
+    return insert_or_ignore(LunchPassArchive.__table__, dialect_name).from_select(
+        ['id', 'student_id', 'token', 'generated_at', 'used', 'used_at', 'archived_at'],
+        select(*columns, bindparam('now', type_=LunchPassArchive.archived_at.type))
+        .where(LunchPass.id == bindparam('pass_id'), LunchPass.used == false()),
+    )
+
+
+def _dialect_name(conn):
+    dialect = getattr(conn, 'dialect', None) or conn.get_bind().dialect
+    return dialect.name
+
+
+def find_student_by_roll(conn, roll_number):
+    """(id, roll_number, name) of the student, or None"""
+    return conn.execute(FIND_STUDENT_BY_ROLL, {'roll': roll_number}).first()
+
+
+def roll_prefix_filter(prefix):
+    """Students whose roll number starts with `prefix`, as a range so the roll_number index is used"""
+    return and_(Student.roll_number >= prefix,
+                Student.roll_number < prefix[:-1] + chr(ord(prefix[-1]) + 1))
+
+
+def roster(conn):
+    """(roll_number, id, name) of every student"""
+    return conn.execute(ROSTER).all()
+
+
+def roster_version(conn):
+    return conn.execute(ROSTER_VERSION).scalar()
+
+
+def active_pass(conn, student_id):
+    """(id, token) of the student's unused pass, or None"""
+    return conn.execute(ACTIVE_PASS, {'holder_id': student_id}).first()
+
+
+def pass_is_active(conn, pass_id, token):
+    """Whether a pass handed out earlier can still be redeemed: unused, and not a signed pass past its expiry"""
+    if signed_pass.has_expired(token):
+        return False
+    return conn.execute(PASS_STILL_ACTIVE, {'pass_id': pass_id}).scalar() is not None
+
+
+def pass_token(conn, pass_id):
+    return conn.execute(PASS_TOKEN, {'pass_id': pass_id}).scalar()
+
+
+def issue_pass(conn, student_id, token, now=None, pass_id=None):
+    """Insert a pass, returning its id, or None if the student already holds an unused one"""
+    params = {'holder_id': student_id, 'new_token': token, 'now': now or datetime.utcnow()}
+    if pass_id is not None:
+        params['new_id'] = pass_id
+    return conn.execute(issue_pass_statement(_dialect_name(conn), pass_id is not None), params).scalar()
+
+
+def replace_expired_pass(conn, expired_id, student_id, token, now=None):
+    """Archive the student's expired, never-redeemed pass and issue `token` in its place
+
+    Returns the new pass id, or None if a concurrent request replaced it first.
+    """
+    now = now or datetime.utcnow()
+    dialect_name = _dialect_name(conn)
+    conn.execute(archive_pass_statement(dialect_name), {'pass_id': expired_id, 'now': now})
+    conn.execute(DELETE_UNUSED_PASS, {'pass_id': expired_id})
+    new_id = conn.execute(NEXT_PASS_ID).scalar() if dialect_name == 'sqlite' else None
+    return issue_pass(conn, student_id, token, now, new_id)
+
+
+def redeem_token(conn, token, now=None):
+    """Mark the pass used if it still is unused, returning its holder's (roll_number, name), or None"""
+    return conn.execute(REDEEM_PASS, {'scanned_token': token, 'now': now or datetime.utcnow()}).first()
+
+
+def rejected_pass(conn, token):
+    """(used_at, name, roll_number) of a pass that could not be redeemed, or None if there is no such pass"""
+    return conn.execute(REJECTED_PASS, {'scanned_token': token}).first()
+
+
+def issued_pass_id(conn, token):
+    """Id of the pass, live or archived, carrying `token`, or None if it was never issued"""
+    return conn.execute(ISSUED_PASS_ID, {'scanned_token': token}).scalar()
+
+
+def stats(conn):
+    """Dashboard statistics from the trigger-maintained counters"""
+    counters = dict(conn.execute(COUNTERS).all())
+    total_students = counters.get('students', 0)
+    total_passes_generated = counters.get('passes_generated', 0)
+    total_passes_used = counters.get('passes_used', 0)
+    return {
+        'total_students': total_students,
+        'total_passes_generated': total_passes_generated,
+        'total_passes_used': total_passes_used,
+        'passes_remaining': total_passes_generated - total_passes_used,
+        'usage_percentage': round((total_passes_used / total_passes_generated * 100) if total_passes_generated > 0 else 0, 1)
+    }
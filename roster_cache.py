@@ -0,0 +1,75 @@
+"""
+In-process roll number -> student cache
+
+Every pass request starts by looking the roll number up, yet the roster
+changes a few times a day. Each worker therefore keeps the whole roster in
+a dict. Any change to the student table, from any process (the admin app,
+a roster import, a hand edit), bumps the roster_version counter through a
+trigger (migration 6); a worker reads that one-row counter at most once
+per `check_interval` seconds and reloads the roster only when it moved.
+
+A miss re-reads the counter before answering, so a student added a moment
+ago through another worker is found rather than rejected; an unknown roll
+number costs that primary-key read and never a roster query.
+"""
+
+import threading
+import time
+from collections import namedtuple
+
+import repository
+
+RosterEntry = namedtuple('RosterEntry', 'id name')
+
+
+class RosterCache:
+    def __init__(self, check_interval=1.0):
+        self.check_interval = check_interval
+        self._students = {}
+        self._version = None
+        self._checked_at = float('-inf')
+        self._lock = threading.Lock()
+        self._hits = self._misses = self._reloads = 0
+
+    def lookup(self, conn, roll_number):
+        """RosterEntry of the student with `roll_number`, or None"""
+        synced = time.monotonic() - self._checked_at >= self.check_interval
+        if synced:
+            self.sync(conn)
+        entry = self._students.get(roll_number)
+        if entry is None and not synced:
+            self.sync(conn)
+            entry = self._students.get(roll_number)
+        if entry is None:
+            self._misses += 1
+        else:
+            self._hits += 1
+        return entry
+
+    def sync(self, conn):
+        """Reload the roster if its version moved since the last check"""
+        with self._lock:
+            # The version is read before the roster: a change committed in
+            # between is then reloaded again on the next check, never missed
+            version = repository.roster_version(conn)
+            if version != self._version:
+                self._students = {
+                    roll_number: RosterEntry(student_id, name)
+                    for roll_number, student_id, name in repository.roster(conn)
+                }
+                self._version = version
+                self._reloads += 1
+            self._checked_at = time.monotonic()
+
+    def invalidate(self):
+        """Check the version on the next lookup; for writes made by this process"""
+        self._checked_at = float('-inf')
+
+    def stats(self):
+        return {
+            'size': len(self._students),
+            'version': self._version,
+            'hits': self._hits,
+            'misses': self._misses,
+            'reloads': self._reloads,
+        }
@@ -0,0 +1,151 @@
+"""
+Set-based student roster import from CSV or Excel
+
+The file is read in chunks (pandas' CSV reader, or openpyxl's read-only
+row stream for .xlsx), roll numbers and names are normalised column-wise,
+and every chunk is checked against the roster loaded up front in one
+query. New students go in as multi-row INSERTs and, with update_names,
+changed names as one executemany UPDATE, committed chunk by chunk.
+
+    python roster_import.py students.xlsx [--update-names]
+
+The roster columns are found by name, ignoring case: any of ROLL_COLUMNS
+for the roll number and, optionally, NAME_COLUMNS for the name.
+"""
+
+import os
+import sys
+import time
+from itertools import islice
+
+import pandas as pd
+import sqlalchemy as sa
+
+ROLL_COLUMNS = ['roll number', 'roll no', 'rollno', 'roll', 'roll_number']
+NAME_COLUMNS = ['name', 'student name', 'full name', 'student_name']
+MISSING_NAME = 'N/A'
+EXTENSIONS = ('.csv', '.xlsx', '.xlsm')
+
+# Only the columns the import touches, so it works against any app's models
+student = sa.Table(
+    'student', sa.MetaData(),
+    sa.Column('id', sa.Integer, primary_key=True),
+    sa.Column('roll_number', sa.String(50)),
+    sa.Column('name', sa.String(100)),
+)
+
+
+class RosterError(ValueError):
+    """The file can't be read as a roster"""
+
+
+def _find_column(columns, candidates):
+    by_name = {str(column).strip().lower(): column for column in columns}
+    return next((by_name[name] for name in candidates if name in by_name), None)
+
+
+def _xlsx_chunks(path, chunk_size):
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        while chunk := list(islice(rows, chunk_size)):
+            yield pd.DataFrame(chunk, columns=header)
+    finally:
+        workbook.close()
+
+
+def read_roster(path, chunk_size=5000):
+    """DataFrames of raw rows, `chunk_size` at a time"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.csv':
+        return pd.read_csv(path, dtype=str, chunksize=chunk_size, skipinitialspace=True)
+    if extension in EXTENSIONS:
+        return _xlsx_chunks(path, chunk_size)
+    raise RosterError(f'Unsupported roster file type: {extension or path} (use .csv or .xlsx)')
+
+
+def _as_text(column):
+    """Cells as stripped strings; Excel's number 1602.0 becomes '1602', text cells are kept as written"""
+    def text(value):
+        if isinstance(value, float) and value.is_integer():
+            return str(int(value))
+        return value
+    return column.map(text, na_action='ignore').astype('string').str.strip()
+
+
+def normalise(frame):
+    """(roll_number, name) rows with upper-cased roll numbers, blanks dropped"""
+    roll_column = _find_column(frame.columns, ROLL_COLUMNS)
+    if roll_column is None:
+        raise RosterError(f'No roll number column among: {", ".join(map(str, frame.columns))}')
+    name_column = _find_column(frame.columns, NAME_COLUMNS)
+    rows = pd.DataFrame({
+        'roll_number': _as_text(frame[roll_column]).str.upper(),
+        'name': _as_text(frame[name_column]) if name_column is not None else pd.NA,
+    })
+    rows = rows[rows['roll_number'].notna() & (rows['roll_number'] != '')]
+    rows['name'] = rows['name'].fillna(MISSING_NAME).replace('', MISSING_NAME)
+    return rows.drop_duplicates('roll_number', keep='last')
+
+
+def import_roster(session, path, update_names=False, chunk_size=5000, progress=None):
+    """
+    Add the students in `path` that aren't on the roster yet (and, with
+    `update_names`, rename those whose name changed). `progress(counts)` is
+    called after each committed chunk. Returns the counts: rows, added,
+    updated, skipped (blank, repeated or unchanged rows) and seconds.
+    """
+    started = time.perf_counter()
+    known = dict(session.execute(sa.select(student.c.roll_number, student.c.name)).all())
+    rename = (
+        student.update()
+        .where(student.c.roll_number == sa.bindparam('roll'))
+        .values(name=sa.bindparam('new_name'))
+    )
+    counts = {'rows': 0, 'added': 0, 'updated': 0, 'skipped': 0}
+    for chunk in read_roster(path, chunk_size):
+        counts['rows'] += len(chunk)
+        rows = normalise(chunk)
+        # Membership, not the known name, decides: a student on file may have no name
+        on_file = rows['roll_number'].isin(known.keys())
+        new = rows[~on_file]
+        current = rows['roll_number'].map(known).fillna('')
+        changed = (rows[on_file & (current != rows['name']) & (rows['name'] != MISSING_NAME)]
+                   if update_names else rows.iloc[:0])
+
+        if len(new):
+            session.execute(student.insert(), new.to_dict('records'))
+        if len(changed):
+            session.execute(rename, changed.rename(columns={'roll_number': 'roll', 'name': 'new_name'})
+                            .to_dict('records'))
+        session.commit()
+
+        known.update(zip(rows['roll_number'], rows['name']))
+        counts['added'] += len(new)
+        counts['updated'] += len(changed)
+        counts['skipped'] += len(chunk) - len(new) - len(changed)
+        if progress:
+            progress(dict(counts, seconds=time.perf_counter() - started))
+    counts['seconds'] = round(time.perf_counter() - started, 3)
+    return counts
+
+
+if __name__ == '__main__':
+    from sqlalchemy.orm import Session
+
+    import db_engine
+
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    if len(args) != 1:
+        print("Usage: python roster_import.py ROSTER.csv|ROSTER.xlsx [--update-names]")
+        sys.exit(1)
+
+    with Session(db_engine.create_engine()) as session:
+        result = import_roster(session, args[0], update_names='--update-names' in sys.argv)
+    print(f"✅ Imported {result['rows']} rows in {result['seconds']:.2f}s: "
+          f"{result['added']} added, {result['updated']} updated, {result['skipped']} skipped")
@@ -0,0 +1,136 @@
+"""
+Signed lunch passes
+
+A signed pass carries its own proof of issue, so a scanner can reject a
+forged or expired code in-process without touching the database:
+
+    P1.<pass id>.<student id>.<meal date>.<expiry>.<signature>
+
+The signature is a truncated HMAC-SHA256 over everything before it, keyed
+with PASS_SIGNING_KEY, which must be the same for the student and admin
+apps (each app's own SECRET_KEY is not). Legacy passes made by
+secrets.token_urlsafe() never contain a dot, so both formats can be
+issued and scanned side by side while signed passes are rolled out.
+"""
+
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+PREFIX = 'P1'
+SIGNATURE_BYTES = 16
+EPOCH = datetime(1970, 1, 1)
+
+SignedPass = namedtuple('SignedPass', 'pass_id student_id meal_date expires_at')
+
+
+class InvalidPass(ValueError):
+    """Token looks like a signed pass but was not issued by us"""
+
+
+class ExpiredPass(InvalidPass):
+    """Genuine signed pass whose meal window is over"""
+
+
+def signed_passes_enabled():
+    """Signed passes are opt-in via SIGNED_PASSES=1 during rollout"""
+    return os.getenv('SIGNED_PASSES', '').lower() in ('1', 'true', 'yes')
+
+
+def signing_key(app_secret=None):
+    """Key shared by the issuing and scanning apps, or None if there is none
+
+    With signed passes on, PASS_SIGNING_KEY is required: falling back to each
+    app's own secret would fail every scan. Otherwise the app secret still
+    keys the student app's QR URLs.
+    """
+    key = os.getenv('PASS_SIGNING_KEY')
+    if not key and signed_passes_enabled():
+        raise RuntimeError('SIGNED_PASSES=1 needs PASS_SIGNING_KEY, set to the same value for the student and admin apps')
+    key = key or app_secret
+    return key.encode() if key else None
+
+
+def pass_ttl():
+    return timedelta(hours=float(os.getenv('PASS_TTL_HOURS', '12')))
+
+
+def is_signed(token):
+    return token.startswith(PREFIX + '.')
+
+
+def _signature(key, body):
+    digest = hmac.new(key, body.encode(), hashlib.sha256).digest()[:SIGNATURE_BYTES]
+    return base64.urlsafe_b64encode(digest).rstrip(b'=').decode()
+
+
+def issue(student_id, key, now=None):
+    """Mint a signed pass for a student, valid for PASS_TTL_HOURS"""
+    now = now or datetime.utcnow()
+    expires_at = int((now + pass_ttl() - EPOCH).total_seconds())
+    body = '.'.join([
+        PREFIX,
+        secrets.token_urlsafe(6),
+        str(student_id),
+        now.strftime('%Y%m%d'),
+        str(expires_at),
+    ])
+    return f'{body}.{_signature(key, body)}'
+
+
+def verify(token, key, now=None):
+    """Check a signed pass in-process, returning its SignedPass claims
+
+    Raises InvalidPass for anything we did not sign and ExpiredPass once
+    the pass has run out.
+    """
+    parts = token.split('.')
+    # Every pass we sign is ASCII; anything else is a garbled read
+    if len(parts) != 6 or parts[0] != PREFIX or not token.isascii():
+        raise InvalidPass('Invalid token')
+
+    body, signature = token.rsplit('.', 1)
+    if not hmac.compare_digest(signature.encode(), _signature(key, body).encode()):
+        raise InvalidPass('Invalid token')
+
+    _, pass_id, student_id, meal_date, expires_at = parts[:5]
+    try:
+        claims = SignedPass(
+            pass_id,
+            int(student_id),
+            datetime.strptime(meal_date, '%Y%m%d').date(),
+            EPOCH + timedelta(seconds=int(expires_at)),
+        )
+    except (ValueError, OverflowError):
+        raise InvalidPass('Invalid token')
+
+    if claims.expires_at <= (now or datetime.utcnow()):
+        raise ExpiredPass('Pass expired')
+    return claims
+
+
+def has_expired(token, now=None):
+    """True for a signed pass past its expiry; legacy passes never expire
+
+    Only the expiry field is read, not the signature, so this is for tokens
+    taken from our own database, never for scanned ones.
+    """
+    parts = token.split('.')
+    if len(parts) != 6 or parts[0] != PREFIX:
+        return False
+    try:
+        expires_at = EPOCH + timedelta(seconds=int(parts[4]))
+    except (ValueError, OverflowError):
+        return False
+    return expires_at <= (now or datetime.utcnow())
+
+
+def new_token(student_id, key):
+    """Token for a new pass: signed when enabled and keyed, legacy random otherwise"""
+    if key and signed_passes_enabled():
+        return issue(student_id, key)
+    return secrets.token_urlsafe(32)
@@ -2,45 +2,142 @@ import streamlit as st
 import sys
 import os
 from datetime import datetime
-import secrets
-import qrcode
-import io
-import base64
-from PIL import Image
 import pandas as pd
-from sqlalchemy import create_engine, Column, Integer, String, Boolean, DateTime
-from sqlalchemy.orm import declarative_base, sessionmaker, relationship
+from sqlalchemy import select, case, false, union_all
+from sqlalchemy.orm import sessionmaker
 from sqlalchemy.sql import func
+import signed_pass
+import db_engine
+import migrations
+import qr_render
+import repository
+import profiling
+from models import db, Student, LunchPass, LunchPassArchive
 
 # Database setup
-ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
-DB_PATH = os.path.join(ROOT_DIR, 'canteen_data.db')
-DATABASE_URL = f'sqlite:///{DB_PATH}'
+DATABASE_URL = db_engine.database_url()
 
-engine = create_engine(DATABASE_URL, echo=False)
-Session = sessionmaker(bind=engine)
-Base = declarative_base()
+# Cached query results live this long before the next reader refreshes them
+CACHE_TTL_SECONDS = int(os.getenv('STREAMLIT_CACHE_TTL', '5'))
 
-# Database Models
-class Student(Base):
-    __tablename__ = 'student'
-    id = Column(Integer, primary_key=True)
-    roll_number = Column(String(50), unique=True, nullable=False)
-    name = Column(String(100), nullable=False)
-    passes = relationship('LunchPass', back_populates='student')
+PASS_SIGNING_KEY = signed_pass.signing_key(os.getenv('SECRET_KEY'))
 
-class LunchPass(Base):
-    __tablename__ = 'lunch_pass'
-    id = Column(Integer, primary_key=True)
-    student_id = Column(Integer, nullable=False)
-    token = Column(String(100), unique=True, nullable=False)
-    generated_at = Column(DateTime, default=datetime.utcnow)
-    used = Column(Boolean, default=False)
-    used_at = Column(DateTime, nullable=True)
-    student = relationship('Student', back_populates='passes')
+@st.cache_resource(show_spinner=False)
+def get_database():
+    """One engine per server process, shared by every session and rerun; migrates on first use"""
+    engine = db_engine.create_engine(DATABASE_URL)
+    migrations.upgrade(engine, db.metadata)
+    profiling.Profiler('streamlit').watch_engine(engine)
+    return engine, sessionmaker(bind=engine)
 
-# Create tables
-Base.metadata.create_all(engine)
+engine, Session = get_database()
+
+@st.cache_resource(show_spinner=False)
+def cache_stats():
+    """Process-wide call and miss counts for the cached queries below"""
+    return {'calls': 0, 'misses': 0}
+
+def cached(loader, *args):
+    """Call a cached loader, counting the call for the sidebar hit rate"""
+    cache_stats()['calls'] += 1
+    return loader(*args)
+
+@st.cache_data(ttl=CACHE_TTL_SECONDS, show_spinner=False)
+def dashboard_totals():
+    cache_stats()['misses'] += 1
+    session = Session()
+    try:
+        return repository.stats(session)
+    finally:
+        session.close()
+
+@st.cache_data(ttl=CACHE_TTL_SECONDS, show_spinner=False)
+def recent_activity(limit=10):
+    cache_stats()['misses'] += 1
+    session = Session()
+    try:
+        return load_recent_activity_frame(session, limit)
+    finally:
+        session.close()
+
+@st.cache_data(ttl=CACHE_TTL_SECONDS, show_spinner=False)
+def students_frame():
+    cache_stats()['misses'] += 1
+    session = Session()
+    try:
+        return load_students_frame(session)
+    finally:
+        session.close()
+
+@st.cache_data(ttl=CACHE_TTL_SECONDS, show_spinner=False)
+def student_choices():
+    cache_stats()['misses'] += 1
+    session = Session()
+    try:
+        return {
+            f"{roll_number} - {name}": student_id
+            for student_id, roll_number, name in session.execute(
+                select(Student.id, Student.roll_number, Student.name).order_by(Student.roll_number)
+            )
+        }
+    finally:
+        session.close()
+
+def invalidate_pass_caches():
+    """Drop cached results a new pass makes stale"""
+    dashboard_totals.clear()
+    recent_activity.clear()
+    students_frame.clear()
+
+def invalidate_roster_caches():
+    """Drop cached results a roster change makes stale"""
+    invalidate_pass_caches()
+    student_choices.clear()
+
+def load_students_frame(session):
+    """Roster with active-pass counts, aggregated in one query"""
+    active_passes = func.coalesce(func.sum(case((LunchPass.used == false(), 1), else_=0)), 0)
+    return pd.read_sql(
+        select(
+            Student.roll_number.label('Roll Number'),
+            Student.name.label('Name'),
+            active_passes.label('Active Passes'),
+        )
+        .outerjoin(LunchPass, LunchPass.student_id == Student.id)
+        .group_by(Student.id, Student.roll_number, Student.name)
+        .order_by(Student.roll_number),
+        session.connection()
+    )
+
+def load_recent_activity_frame(session, limit=10):
+    """Latest passes, live or archived, joined to their students in one query"""
+    def latest(model):
+        # Each table's newest rows off its generated_at index, then the newest of both
+        return select(
+            select(model.student_id, model.generated_at, model.used, model.used_at)
+            .order_by(model.generated_at.desc())
+            .limit(limit)
+            .subquery()
+        )
+    passes = union_all(latest(LunchPass), latest(LunchPassArchive)).subquery()
+    df = pd.read_sql(
+        select(
+            Student.roll_number.label('Roll Number'),
+            Student.name.label('Student Name'),
+            passes.c.generated_at.label('Generated'),
+            passes.c.used.label('Status'),
+            passes.c.used_at.label('Used At'),
+        )
+        .join(Student, Student.id == passes.c.student_id)
+        .order_by(passes.c.generated_at.desc())
+        .limit(limit),
+        session.connection(),
+        parse_dates=['Generated', 'Used At']
+    )
+    df['Generated'] = df['Generated'].dt.strftime("%Y-%m-%d %H:%M")
+    df['Status'] = df['Status'].astype(bool).map({True: "Used", False: "Active"})
+    df['Used At'] = df['Used At'].dt.strftime("%Y-%m-%d %H:%M").fillna("-")
+    return df
 
 # Streamlit page config
 st.set_page_config(
@@ -95,6 +192,12 @@ page = st.sidebar.radio(
 st.sidebar.markdown("---")
 st.sidebar.markdown("**System Status:** ✅ Active")
 st.sidebar.markdown(f"**Last Updated:** {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+_cache = cache_stats()
+_hits = _cache['calls'] - _cache['misses']
+st.sidebar.caption(
+    f"Query cache: {_hits} hits / {_cache['misses']} misses"
+    + (f" ({_hits / _cache['calls']:.0%} hit rate)" if _cache['calls'] else "")
+)
 
 # ================== STUDENT PORTAL ==================
 if page == "📱 Student Portal":
@@ -118,53 +221,37 @@ if page == "📱 Student Portal":
             else:
                 session = Session()
                 try:
-                    student = session.query(Student).filter_by(roll_number=roll_number).first()
+                    student = repository.find_student_by_roll(session, roll_number)
                     
                     if not student:
                         st.error(f"❌ Roll number '{roll_number}' not found in system")
                         st.info("Contact admin if your roll number is incorrect")
                     else:
-                        # Check if already has unused pass
-                        existing_pass = session.query(LunchPass).filter_by(
-                            student_id=student.id, 
-                            used=False
-                        ).first()
+                        # One INSERT guarded by the "one unused pass per student" index
+                        token = signed_pass.new_token(student.id, PASS_SIGNING_KEY)
+                        pass_id = repository.issue_pass(session, student.id, token)
+                        if not pass_id:
+                            # A held pass that expired unused is replaced rather than shown again
+                            held = repository.active_pass(session, student.id)
+                            if held and signed_pass.has_expired(held.token):
+                                pass_id = repository.replace_expired_pass(session, held.id, student.id, token)
+                        session.commit()
+                        if pass_id:
+                            invalidate_pass_caches()
                         
-                        if existing_pass:
-                            st.warning("⚠️ You already have an active lunch pass!")
-                            st.info(f"Token: {existing_pass.token}")
+                        if not pass_id:
+                            existing_pass = repository.active_pass(session, student.id)
+                            if existing_pass:
+                                # Re-show the pass they already hold; its render is cached by token
+                                st.info("ℹ️ You already have an active lunch pass - here it is again")
+                                token = existing_pass.token
+                            else:
+                                st.error("❌ Could not issue a lunch pass, please try again")
+                                token = None
                         else:
-                            # Generate new token
-                            token = secrets.token_urlsafe(32)
-                            new_pass = LunchPass(
-                                student_id=student.id,
-                                token=token
-                            )
-                            session.add(new_pass)
-                            session.commit()
-                            
-                            # Generate QR code
-                            qr = qrcode.QRCode(
-                                version=1,
-                                box_size=10,
-                                border=5
-                            )
-                            qr.add_data(token)
-                            qr.make(fit=True)
-                            
-                            img = qr.make_image(
-                                fill_color="black",
-                                back_color="white"
-                            )
-                            
-                            # Convert to base64
-                            img_io = io.BytesIO()
-                            img.save(img_io, 'PNG')
-                            img_io.seek(0)
-                            img_base64 = base64.b64encode(img_io.getvalue()).decode()
-                            
                             st.success(f"✅ QR Code Generated for {student.name}!")
-                            st.session_state.qr_code = img_base64
+                        if token:
+                            st.session_state.qr_code = qr_render.render(token, 'png')
                             st.session_state.token = token
                             st.session_state.student_name = student.name
                 finally:
@@ -178,8 +265,7 @@ if page == "📱 Student Portal":
             st.markdown("---")
             
             # Display QR
-            qr_html = f'<img src="data:image/png;base64,{st.session_state.qr_code}" width="300">'
-            st.markdown(qr_html, unsafe_allow_html=True)
+            st.image(st.session_state.qr_code, width=300)
             
             st.success("✅ Show this QR code at the canteen")
             st.info("⚠️ Each QR code can only be used once!")
@@ -225,30 +311,13 @@ elif page == "👨‍💼 Admin Panel":
         with admin_tab1:
             st.subheader("All Registered Students")
             
-            session = Session()
-            try:
-                students = session.query(Student).all()
-                
-                if students:
-                    student_data = []
-                    for s in students:
-                        active_count = session.query(LunchPass).filter_by(
-                            student_id=s.id,
-                            used=False
-                        ).count()
-                        student_data.append({
-                            'Roll Number': s.roll_number,
-                            'Name': s.name,
-                            'Active Passes': active_count
-                        })
-                    
-                    df = pd.DataFrame(student_data)
-                    st.dataframe(df, use_container_width=True, hide_index=True)
-                    st.info(f"Total Students: {len(students)}")
-                else:
-                    st.warning("No students found")
-            finally:
-                session.close()
+            df = cached(students_frame)
+            
+            if not df.empty:
+                st.dataframe(df, use_container_width=True, hide_index=True)
+                st.info(f"Total Students: {len(df)}")
+            else:
+                st.warning("No students found")
         
         with admin_tab2:
             st.subheader("Add New Student")
@@ -265,13 +334,14 @@ elif page == "👨‍💼 Admin Panel":
                 else:
                     session = Session()
                     try:
-                        existing = session.query(Student).filter_by(roll_number=new_roll).first()
+                        existing = repository.find_student_by_roll(session, new_roll)
                         if existing:
                             st.error(f"❌ Roll number {new_roll} already exists")
                         else:
                             new_student = Student(roll_number=new_roll, name=new_name)
                             session.add(new_student)
                             session.commit()
+                            invalidate_roster_caches()
                             st.success(f"✅ Student {new_name} added!")
                             st.rerun()
                     finally:
@@ -280,15 +350,7 @@ elif page == "👨‍💼 Admin Panel":
         with admin_tab3:
             st.subheader("Delete Student")
             
-            session = Session()
-            try:
-                students = session.query(Student).all()
-                student_options = {
-                    f"{s.roll_number} - {s.name}": s.id 
-                    for s in students
-                }
-            finally:
-                session.close()
+            student_options = cached(student_choices)
             
             if student_options:
                 selected = st.selectbox(
@@ -305,6 +367,7 @@ elif page == "👨‍💼 Admin Panel":
                         session.commit()
                     finally:
                         session.close()
+                    invalidate_roster_caches()
                     st.success(f"✅ Student deleted!")
                     st.rerun()
             else:
@@ -316,93 +379,78 @@ elif page == "📊 Dashboard":
     st.markdown("Real-time system statistics and analytics")
     st.markdown("---")
     
-    session = Session()
-    try:
-        total_students = session.query(Student).count()
-        total_passes = session.query(LunchPass).count()
-        used_passes = session.query(LunchPass).filter_by(used=True).count()
-        active_passes = total_passes - used_passes
-        
-        # Metrics
-        col1, col2, col3, col4 = st.columns(4)
-        
-        with col1:
-            st.metric(
-                "👥 Total Students",
-                total_students,
-                delta=None
-            )
-        
-        with col2:
+    totals = cached(dashboard_totals)
+    total_students = totals['total_students']
+    total_passes = totals['total_passes_generated']
+    used_passes = totals['total_passes_used']
+    active_passes = totals['passes_remaining']
+    
+    # Metrics
+    col1, col2, col3, col4 = st.columns(4)
+    
+    with col1:
+        st.metric(
+            "👥 Total Students",
+            total_students,
+            delta=None
+        )
+    
+    with col2:
+        st.metric(
+            "📋 Total Passes Generated",
+            total_passes,
+            delta=None
+        )
+    
+    with col3:
+        st.metric(
+            "✅ Active Passes",
+            active_passes,
+            delta=f"-{used_passes} used"
+        )
+    
+    with col4:
+        if total_passes > 0:
+            usage_percent = (used_passes / total_passes) * 100
             st.metric(
-                "📋 Total Passes Generated",
-                total_passes,
+                "📈 Usage Rate",
+                f"{usage_percent:.1f}%",
                 delta=None
             )
-        
-        with col3:
-            st.metric(
-                "✅ Active Passes",
-                active_passes,
-                delta=f"-{used_passes} used"
-            )
-        
-        with col4:
-            if total_passes > 0:
-                usage_percent = (used_passes / total_passes) * 100
-                st.metric(
-                    "📈 Usage Rate",
-                    f"{usage_percent:.1f}%",
-                    delta=None
-                )
-            else:
-                st.metric("📈 Usage Rate", "0%", delta=None)
-        
-        st.markdown("---")
-        
-        # Charts
-        col1, col2 = st.columns(2)
-        
-        with col1:
-            st.subheader("Pass Usage Status")
-            usage_data = {
-                'Status': ['Used', 'Available'],
-                'Count': [used_passes, active_passes]
-            }
-            usage_df = pd.DataFrame(usage_data)
-            st.bar_chart(usage_df.set_index('Status'))
-        
-        with col2:
-            st.subheader("Student Distribution")
-            st.info(f"""
-            - Total registered students: {total_students}
-            - Generated passes: {total_passes}
-            - Passes per student: {total_passes / max(total_students, 1):.2f}
-            """)
-        
-        st.markdown("---")
-        st.markdown("### Recent Activity")
-        
-        recent_passes = session.query(LunchPass).order_by(LunchPass.generated_at.desc()).limit(10).all()
-        
-        if recent_passes:
-            activity_data = []
-            for p in recent_passes:
-                student = session.query(Student).get(p.student_id)
-                activity_data.append({
-                    'Roll Number': student.roll_number,
-                    'Student Name': student.name,
-                    'Generated': p.generated_at.strftime("%Y-%m-%d %H:%M"),
-                    'Status': "Used" if p.used else "Active",
-                    'Used At': p.used_at.strftime("%Y-%m-%d %H:%M") if p.used_at else "-"
-                })
-            
-            activity_df = pd.DataFrame(activity_data)
-            st.dataframe(activity_df, use_container_width=True, hide_index=True)
         else:
-            st.info("No passes generated yet")
-        
-        st.markdown("---")
-        st.caption("Data updates in real-time")
-    finally:
-        session.close()
+            st.metric("📈 Usage Rate", "0%", delta=None)
+    
+    st.markdown("---")
+    
+    # Charts
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        st.subheader("Pass Usage Status")
+        usage_data = {
+            'Status': ['Used', 'Available'],
+            'Count': [used_passes, active_passes]
+        }
+        usage_df = pd.DataFrame(usage_data)
+        st.bar_chart(usage_df.set_index('Status'))
+    
+    with col2:
+        st.subheader("Student Distribution")
+        st.info(f"""
+        - Total registered students: {total_students}
+        - Generated passes: {total_passes}
+        - Passes per student: {total_passes / max(total_students, 1):.2f}
+        """)
+    
+    st.markdown("---")
+    st.markdown("### Recent Activity")
+    
+    activity_df = cached(recent_activity)
+    
+    if not activity_df.empty:
+        st.dataframe(activity_df, use_container_width=True, hide_index=True)
+    else:
+        st.info("No passes generated yet")
+    
+    st.markdown("---")
+    st.caption(f"Figures are cached for up to {CACHE_TTL_SECONDS}s and refresh immediately after changes made here")
@@ -0,0 +1,59 @@
+"""
+Per-worker cache of each student's active pass, keyed by roll number
+
+During the rush students press Generate again and again. Once a pass has
+been handed out, repeats are answered from here: the only database work is
+a primary-key read confirming the pass is still unused, since redemption
+happens in the scanner process. A pass found used (or gone) is dropped and
+the request falls through to normal issuance.
+"""
+
+import threading
+from collections import OrderedDict, namedtuple
+
+ActivePass = namedtuple('ActivePass', 'student_name pass_id token')
+
+
+class ActivePassCache:
+    def __init__(self, max_entries=20000):
+        self._max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+        self._invalidated = 0
+
+    def get(self, roll_number):
+        with self._lock:
+            entry = self._entries.get(roll_number)
+            if entry is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(roll_number)
+            self._hits += 1
+            return entry
+
+    def put(self, roll_number, entry):
+        with self._lock:
+            self._entries[roll_number] = entry
+            self._entries.move_to_end(roll_number)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, roll_number):
+        """The cached pass was redeemed or deleted"""
+        with self._lock:
+            if self._entries.pop(roll_number, None) is not None:
+                self._invalidated += 1
+                # The lookup that found it was not a usable hit after all
+                self._hits -= 1
+                self._misses += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'hits': self._hits,
+                'misses': self._misses,
+                'invalidated': self._invalidated,
+            }
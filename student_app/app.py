@@ -1,35 +1,75 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, render_template, request, jsonify, url_for
 from flask_sqlalchemy import SQLAlchemy
-import qrcode
-import io
 import base64
-import secrets
+import hashlib
+import hmac
 import os
-from datetime import datetime
 import sys
 
 # Add parent directory to path for shared models
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from models import db, Student, LunchPass
+from models import db
+import db_engine
+import migrations
+import repository
+from metrics import Metrics
+import profiling
+import qr_render
+import signed_pass
+from active_pass_cache import ActivePass, ActivePassCache
+from roster_cache import RosterCache
 
 app = Flask(__name__)
 
 # Database Configuration
-# Point to root directory for shared database between apps
-ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-DB_PATH = os.path.join(ROOT_DIR, 'canteen_data.db')
-DATABASE_URL = os.getenv('DATABASE_URL', f'sqlite:///{DB_PATH}')
-if DATABASE_URL.startswith('postgres://'):
-    DATABASE_URL = DATABASE_URL.replace('postgres://', 'postgresql://', 1)
+# Shared canteen_data.db at the repository root unless DATABASE_URL is set
+DATABASE_URL = db_engine.database_url()
 
 app.config['SQLALCHEMY_DATABASE_URI'] = DATABASE_URL
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = db_engine.engine_options(DATABASE_URL)
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'student-secret-key-change-this')
 
 db.init_app(app)
 
-def create_tables():
-    db.create_all()
+PASS_SIGNING_KEY = signed_pass.signing_key(app.config['SECRET_KEY'])
+
+request_metrics = Metrics('student')
+profiler = profiling.Profiler('student')
+
+with app.app_context():
+    db_engine.configure(db.engine)
+    migrations.upgrade(db.engine, db.metadata)
+    request_metrics.init_app(app, db.engine)
+    profiler.init_app(app, db.engine)
+
+active_passes = ActivePassCache(int(os.getenv('ACTIVE_PASS_CACHE_SIZE', '20000')))
+roster = RosterCache(float(os.getenv('ROSTER_CHECK_INTERVAL', '1.0')))
+
+with app.app_context():
+    roster.sync(db.session)
+    db.session.remove()
+
+def qr_url_key(pass_id):
+    """Unguessable key for a pass's QR URL, so ids can't be walked to read other students' codes"""
+    digest = hmac.new(PASS_SIGNING_KEY, f'qr:{pass_id}'.encode(), hashlib.sha256).digest()[:12]
+    return base64.urlsafe_b64encode(digest).decode()
+
+def pass_response(active_pass, existing):
+    """JSON body for a pass; the QR image is served (and cached) separately instead of inlined"""
+    if existing:
+        message = f'Welcome back {active_pass.student_name}! Here is your active lunch pass.'
+    else:
+        message = f'Welcome {active_pass.student_name}! Your lunch pass is ready.'
+    key = qr_url_key(active_pass.pass_id)
+    return jsonify({
+        'success': True,
+        'token': active_pass.token,
+        'qr_code': url_for('pass_qr', pass_id=active_pass.pass_id, fmt='png', k=key),
+        'qr_svg': url_for('pass_qr', pass_id=active_pass.pass_id, fmt='svg', k=key),
+        'message': message,
+        'existing': existing
+    })
 
 # ==================== STUDENT PORTAL ====================
 @app.route('/')
@@ -47,46 +87,67 @@ def student_generate():
         if not roll_number:
             return jsonify({'error': 'Roll number required'}), 400
         
-        # Check if student exists
-        student = Student.query.filter_by(roll_number=roll_number).first()
+        student = roster.lookup(db.session, roll_number)
         
         if not student:
             return jsonify({'error': 'Roll number not found in system'}), 404
         
-        # Check if already has unused pass
-        existing_pass = LunchPass.query.filter_by(student_id=student.id, used=False).first()
-        if existing_pass:
-            return jsonify({'error': 'You already have an active lunch pass!'}), 400
+        # Repeat presses re-serve the pass already handed out, if still unused and unexpired
+        cached = active_passes.get(roll_number)
+        if cached:
+            if repository.pass_is_active(db.session, cached.pass_id, cached.token):
+                return pass_response(cached, existing=True)
+            active_passes.invalidate(roll_number)
         
-        # Generate new token
-        token = secrets.token_urlsafe(32)
-        new_pass = LunchPass(student_id=student.id, token=token)
-        db.session.add(new_pass)
-        db.session.commit()
+        # Hand back the pass the student already holds, or issue one
+        held = repository.active_pass(db.session, student.id)
+        existing = held is not None and not signed_pass.has_expired(held.token)
+        if existing:
+            pass_id, token = held
+        else:
+            token = signed_pass.new_token(student.id, PASS_SIGNING_KEY)
+            if held:
+                # The held pass expired unused; the scanner would turn it away
+                pass_id = repository.replace_expired_pass(db.session, held.id, student.id, token)
+            else:
+                pass_id = repository.issue_pass(db.session, student.id, token)
+            db.session.commit()
+            if not pass_id:
+                # A concurrent request for the same student won the insert
+                held = repository.active_pass(db.session, student.id)
+                if not held:
+                    return jsonify({'error': 'Could not issue a lunch pass, please try again'}), 409
+                (pass_id, token), existing = held, True
         
-        # Generate QR code
-        qr = qrcode.QRCode(version=1, box_size=10, border=5)
-        qr.add_data(token)
-        qr.make(fit=True)
-        
-        img = qr.make_image(fill_color="black", back_color="white")
-        img_io = io.BytesIO()
-        img.save(img_io, 'PNG')
-        img_io.seek(0)
-        img_base64 = base64.b64encode(img_io.getvalue()).decode()
-        
-        return jsonify({
-            'success': True,
-            'token': token,
-            'qr_code': f'data:image/png;base64,{img_base64}',
-            'message': f'Welcome {student.name}! Your lunch pass is ready.'
-        })
+        active_pass = ActivePass(student.name, pass_id, token)
+        active_passes.put(roll_number, active_pass)
+        return pass_response(active_pass, existing)
     
     return render_template('student_generate.html')
 
+@app.route('/pass/<int:pass_id>/qr.<fmt>')
+def pass_qr(pass_id, fmt):
+    """QR code of a pass as PNG or SVG; the image never changes, so browsers may keep it"""
+    supplied = request.args.get('k', '').encode()
+    if fmt not in qr_render.FORMATS or not hmac.compare_digest(supplied, qr_url_key(pass_id).encode()):
+        return jsonify({'error': 'Pass not found'}), 404
+    
+    token = repository.pass_token(db.session, pass_id)
+    if token is None:
+        return jsonify({'error': 'Pass not found'}), 404
+    
+    response = Response(qr_render.render(token, fmt), mimetype=qr_render.FORMATS[fmt])
+    response.headers['Cache-Control'] = 'private, max-age=86400, immutable'
+    response.set_etag(hashlib.sha256(f'{fmt}:{token}'.encode()).hexdigest()[:20])
+    return response.make_conditional(request)
+
+@app.route('/api/qr-cache/stats')
+def qr_cache_stats():
+    """Hit/miss counts of this worker's rendered QR, active pass and roster caches"""
+    return jsonify({**qr_render.cache_info(), 'active_passes': active_passes.stats(), 'roster': roster.stats()})
+
 if __name__ == '__main__':
     with app.app_context():
-        create_tables()
         print("\n🎓 STUDENT PORTAL Running!")
         print("📱 Access at: http://localhost:5000")
         print("Press Ctrl+C to stop\n")
@@ -16,11 +16,12 @@ def init_cloud_database():
     # Import Flask app
     try:
         from app import app, db
+        import migrations
         
         with app.app_context():
-            # Create all tables
-            db.create_all()
-            print("✅ Database tables created successfully")
+            # Bring the schema up to the latest migration
+            applied = migrations.upgrade(db.engine, db.metadata)
+            print(f"✅ Database schema up to date (applied: {applied or 'none'})")
             
             # Check if students exist (should be seeded from local db)
             from models import Student